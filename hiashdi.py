@@ -51,6 +51,7 @@ from threading import Thread
 from modules.helpers import helpers
 from modules.broker import broker
 from modules.data import data
+from modules.ingestion import ingestion
 from modules.mongodb import mongodb
 from modules.mqtt import mqtt
 
@@ -110,6 +111,21 @@ class hiashdi():
 
 		self.data = data(self.helpers, self.mongodb, self.broker)
 
+	def configureIngestion(self):
+		""" Configures the HIASHDI iotJumpWay ingestion. """
+
+		if self.confs["ingestion"]["enabled"] is False:
+			return
+
+		self.ingestion = ingestion(self.helpers, self.data)
+		self.mqtt.actuatorCallback = self.ingestion.callback
+		self.mqtt.commandsCallback = self.ingestion.callback
+		self.mqtt.lifeCallback = self.ingestion.callback
+		self.mqtt.sensorsCallback = self.ingestion.callback
+		self.mqtt.statusCallback = self.ingestion.callback
+		self.ingestion.start()
+		self.mqtt.subscribe()
+
 	def configureTypes(self):
 		""" Configures the HIASHDI entity types. """
 
@@ -134,7 +150,15 @@ class hiashdi():
 			"CPU": psutil.cpu_percent(),
 			"Memory": psutil.virtual_memory()[2],
 			"Diskspace": psutil.disk_usage('/').percent,
-			"Temperature": psutil.sensors_temperatures()['coretemp'][0].current
+			"Temperature": psutil.sensors_temperatures()['coretemp'][0].current,
+			"MQTT": self.mqtt.queueStats(),
+			"Spill": self.data.spill.stats() if self.data.spill is not None else None,
+			"Idempotency": self.data.dedupe.stats() if self.data.dedupe is not None else None,
+			"Query": self.data.query.stats(),
+			"Counts": self.data.counts.stats(),
+			"Indexes": self.data.indexes.report() if self.data.indexes is not None else None,
+			"Results": self.data.results.stats() if self.data.results is not None else None,
+			"Entities": self.data.entities.stats()
 		}
 
 	def processHeaders(self, request):
@@ -154,7 +178,7 @@ class hiashdi():
 		""" Builds the request response """
 
 		headers = {}
-		if "application/json" in accepted:
+		if "application/json" in accepted or "text/plain" not in accepted:
 			response =  Response(response=response, status=responseCode,
 					mimetype="application/json")
 			headers['Content-Type'] = 'application/json'
@@ -193,12 +217,21 @@ class hiashdi():
 
 	def signal_handler(self, signal, frame):
 		self.helpers.logger.info("Disconnecting")
+		if hasattr(self, "ingestion"):
+			self.ingestion.stop()
 		sys.exit(1)
 
 
 hiashdi = hiashdi()
 app = Flask(hiashdi.component)
 
+@app.after_request
+def compress(response):
+	""" Compresses responses for the encodings the client accepts. """
+
+	return hiashdi.broker.compression.compress(response,
+			request.headers.get('Accept-Encoding'))
+
 @app.route('/', methods=['GET'])
 def about():
 	""" Responds to GET requests sent to the /v1/ API endpoint. """
@@ -209,7 +242,7 @@ def about():
 	if content_type is False:
 		return hiashdi.respond(415, hiashdi.confs["errorMessages"][str(415)], "application/json")
 
-	return hiashdi.respond(200, json.dumps(json.loads(json_util.dumps(hiashdi.getBroker())), indent=4), accepted)
+	return hiashdi.respond(200, hiashdi.broker.encode(hiashdi.getBroker(), hiashdi.broker.pretty()), accepted)
 
 
 @app.route('/data', methods=['GET'])
@@ -241,7 +274,56 @@ def dataPost():
 	if query is False:
 		return hiashdi.respond(400, hiashdi.helpers.confs["errorMessages"]["400p"], accepted)
 
-	return hiashdi.data.createData(query, request.args.get('type'), accepted)
+	return hiashdi.data.createData(query, request.args.get('type'), accepted,
+				request.headers.get('Idempotency-Key'))
+
+
+@app.route('/data/export', methods=['GET'])
+def dataExportGet():
+	""" Responds to GET requests sent to the /v1/data/export API endpoint. """
+
+	accepted, content_type = hiashdi.processHeaders(request)
+
+	if request.args.get('type') is None:
+		return hiashdi.respond(400, hiashdi.helpers.confs["errorMessages"]["400b"], "application/json")
+	if accepted is False:
+		return hiashdi.respond(406, hiashdi.confs["errorMessages"][str(406)], "application/json")
+	if content_type is False:
+		return hiashdi.respond(415, hiashdi.confs["errorMessages"][str(415)], "application/json")
+
+	return hiashdi.data.getExport(request.args, accepted)
+
+
+@app.route('/data/stats', methods=['GET'])
+def dataStatsGet():
+	""" Responds to GET requests sent to the /v1/data/stats API endpoint. """
+
+	accepted, content_type = hiashdi.processHeaders(request)
+
+	if request.args.get('type') is None:
+		return hiashdi.respond(400, hiashdi.helpers.confs["errorMessages"]["400b"], "application/json")
+	if accepted is False:
+		return hiashdi.respond(406, hiashdi.confs["errorMessages"][str(406)], "application/json")
+	if content_type is False:
+		return hiashdi.respond(415, hiashdi.confs["errorMessages"][str(415)], "application/json")
+
+	return hiashdi.data.getStats(request.args, accepted)
+
+
+@app.route('/data/batch', methods=['POST'])
+def dataBatchPost():
+	""" Responds to POST requests sent to the /v1/data/batch API endpoint. """
+
+	accepted, content_type = hiashdi.processHeaders(request)
+
+	if request.args.get('type') is None:
+		return hiashdi.respond(400, hiashdi.helpers.confs["errorMessages"]["400b"], "application/json")
+
+	query = hiashdi.broker.checkBatchBody(request)
+	if query is False:
+		return hiashdi.respond(400, hiashdi.helpers.confs["errorMessages"]["400p"], accepted)
+
+	return hiashdi.data.createDatas(query, request.args.get('type'), accepted)
 
 
 @app.route('/data/<_id>', methods=['GET'])
@@ -262,7 +344,8 @@ def entityGet(_id):
 	else:
 		attrs = request.args.get('attrs')
 
-	return hiashdi.data.getData(request.args.get('type'), _id, attrs, accepted)
+	return hiashdi.data.getData(request.args.get('type'), _id, attrs, accepted,
+				request.headers.get('If-None-Match'))
 
 def main():
 	signal.signal(signal.SIGINT, hiashdi.signal_handler)
@@ -272,6 +355,7 @@ def main():
 	hiashdi.mongoDbConnection()
 	hiashdi.hiashdiConnection()
 	hiashdi.configureData()
+	hiashdi.configureIngestion()
 
 	Thread(target=hiashdi.life, args=(), daemon=True).start()
 
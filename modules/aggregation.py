@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+""" HIASHDI Aggregation Module.
+
+This module downsamples historical data server side, grouping the
+readings of each entity into time buckets and reducing the requested
+attributes with min, max, avg, sum, count, first or last.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from bson.son import SON
+
+
+class aggregation():
+	""" HIASHDI Aggregation Module.
+
+	This module downsamples historical data server side, grouping the
+	readings of each entity into time buckets and reducing the requested
+	attributes with min, max, avg, sum, count, first or last.
+
+	Plain collections, native time series collections and uncompressed
+	buckets are reduced by a MongoDB aggregation pipeline. Compressed
+	buckets are decoded by the buckets module, so their readings are
+	reduced here instead.
+
+	Attributes may be stored as plain values or as NGSI attributes with a
+	value key. Each result has the form:
+
+		{"<entityField>": ..., "<timeField>": <bucket start>,
+			"<attr>": {"<method>": ..., ...}, ...}
+	"""
+
+	methods = ["avg", "count", "first", "last", "max", "min", "sum"]
+	periods = ["year", "month", "day", "hour", "minute", "second"]
+	parts = {
+		"year": "$year",
+		"month": "$month",
+		"day": "$dayOfMonth",
+		"hour": "$hour",
+		"minute": "$minute",
+		"second": "$second"
+	}
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Aggregation Module"
+
+		self.data = data
+
+		self.timeField = self.helpers.confs["data"]["timeField"]
+		self.entityField = self.helpers.confs["data"]["entityField"]
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def prepare(self, aggrMethod, aggrPeriod, attrs):
+		""" Validates the aggregation parameters.
+
+		Raises ValueError if a method or the period is not supported, or no
+		attributes are given.
+		"""
+
+		methods = aggrMethod.split(",")
+		for method in methods:
+			if method not in self.methods:
+				raise ValueError("Unsupported aggrMethod " + method)
+
+		period = aggrPeriod if aggrPeriod is not None else "hour"
+		if period not in self.periods:
+			raise ValueError("Unsupported aggrPeriod " + period)
+
+		if not len(attrs) or "*" in attrs:
+			raise ValueError("aggrMethod requires a list of attrs")
+
+		return methods, period
+
+	def aggregate(self, typeof, query, attrs, methods, period, offset=0, limit=0):
+		""" Downsamples the readings of a type that match a query. """
+
+		buckets = self.data.buckets
+		if buckets is not None and buckets.isBucketed(typeof):
+			if buckets.confs["compress"]["enabled"]:
+				return self.reduce(buckets.find(typeof, query), attrs,
+					methods, period, offset, limit)
+			return list(buckets.getBuckets(typeof).aggregate(
+				buckets.pipeline(typeof, query) +
+					self.pipeline({}, attrs, methods, period, offset, limit),
+				allowDiskUse=True))
+
+		return list(self.data.getCollection(typeof).aggregate(
+			self.pipeline(query, attrs, methods, period, offset, limit),
+			allowDiskUse=True))
+
+	def value(self, attr):
+		""" Expression for the value of a plain or NGSI attribute. """
+
+		return {"$ifNull": ["$" + attr + ".value", "$" + attr]}
+
+	def bucket(self, period):
+		""" Expression truncating the time field to the start of its bucket. """
+
+		parts = {}
+		for name in self.periods[:self.periods.index(period) + 1]:
+			parts[name] = {self.parts[name]: "$" + self.timeField}
+
+		return {"$dateFromParts": parts}
+
+	def accumulator(self, attr, method):
+		""" Group accumulator for one attribute and method. """
+
+		if method == "count":
+			return {"$sum": {"$cond": [{"$gt": [self.value(attr), None]}, 1, 0]}}
+
+		return {"$" + method: self.value(attr)}
+
+	def pipeline(self, query, attrs, methods, period, offset=0, limit=0):
+		""" Builds the downsampling aggregation pipeline. """
+
+		pipeline = [{"$match": {"$and": [query, {self.timeField: {"$type": "date"}}]}}]
+
+		if "first" in methods or "last" in methods:
+			pipeline.append({"$sort": {self.timeField: 1}})
+
+		group = {"_id": {
+			"e": "$" + self.entityField,
+			"t": self.bucket(period)
+		}}
+		project = {
+			"_id": 0,
+			self.entityField: "$_id.e",
+			self.timeField: "$_id.t"
+		}
+		for i, attr in enumerate(attrs):
+			project[attr] = {}
+			for method in methods:
+				group["a" + str(i) + "_" + method] = self.accumulator(attr, method)
+				project[attr][method] = "$a" + str(i) + "_" + method
+
+		pipeline.append({"$group": group})
+		pipeline.append({"$sort": SON([("_id.t", 1), ("_id.e", 1)])})
+		if offset:
+			pipeline.append({"$skip": offset})
+		if limit:
+			pipeline.append({"$limit": limit})
+		pipeline.append({"$project": project})
+
+		return pipeline
+
+	def truncate(self, time, period):
+		""" Truncates a datetime to the start of its bucket. """
+
+		parts = {"month": 1, "day": 1, "hour": 0, "minute": 0, "second": 0}
+		for name in self.periods[:self.periods.index(period) + 1]:
+			parts.pop(name, None)
+
+		return time.replace(microsecond=0, **parts)
+
+	def reduce(self, readings, attrs, methods, period, offset=0, limit=0):
+		""" Downsamples decoded readings the way the pipeline does. """
+
+		groups = {}
+		for reading in sorted((reading for reading in readings
+				if isinstance(reading.get(self.timeField), datetime)),
+				key=lambda reading: reading[self.timeField]):
+			key = (self.truncate(reading[self.timeField], period),
+				str(reading.get(self.entityField)))
+			group = groups.setdefault(key, {
+				"entity": reading.get(self.entityField),
+				"values": [[] for attr in attrs]
+			})
+			for i, attr in enumerate(attrs):
+				value = reading.get(attr)
+				if isinstance(value, dict) and value.get("value") is not None:
+					value = value["value"]
+				group["values"][i].append(value)
+
+		results = []
+		for key in sorted(groups)[offset:offset + limit if limit else None]:
+			result = {
+				self.entityField: groups[key]["entity"],
+				self.timeField: key[0]
+			}
+			for i, attr in enumerate(attrs):
+				values = groups[key]["values"][i]
+				result[attr] = {method: self.reduction(values, method) for method in methods}
+			results.append(result)
+
+		return results
+
+	def rank(self, value):
+		""" Sort key that orders values of different types like MongoDB. """
+
+		if isinstance(value, bool):
+			return (8, value)
+		if isinstance(value, (int, float)):
+			return (1, value)
+		if isinstance(value, str):
+			return (2, value)
+		if isinstance(value, dict):
+			return (3, str(value))
+		if isinstance(value, list):
+			return (4, str(value))
+		if isinstance(value, bytes):
+			return (5, value)
+		if isinstance(value, ObjectId):
+			return (7, value)
+		if isinstance(value, datetime):
+			return (9, value)
+		return (6, str(value))
+
+	def reduction(self, values, method):
+		""" Reduces the values of a group with a method, like its accumulator.
+
+		Values are None where a reading has no value. sum and avg only use
+		numbers, count, min and max use every value, and first and last use
+		the first and last reading whatever its value.
+		"""
+
+		if method == "first":
+			return values[0] if len(values) else None
+		if method == "last":
+			return values[-1] if len(values) else None
+
+		present = [value for value in values if value is not None]
+		if method == "count":
+			return len(present)
+		if method == "min":
+			return min(present, key=self.rank) if len(present) else None
+		if method == "max":
+			return max(present, key=self.rank) if len(present) else None
+
+		numbers = [value for value in present if isinstance(value, (int, float))
+			and not isinstance(value, bool)]
+		if method == "sum":
+			return sum(numbers)
+		return sum(numbers) / len(numbers) if len(numbers) else None
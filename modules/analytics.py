@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" HIASHDI Analytics Module.
+
+This module computes summary statistics of historical data server side,
+so clients do not need to download full histories.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import array
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from datetime import datetime, timedelta
+
+
+class analytics():
+	""" HIASHDI Analytics Module.
+
+	This module computes summary statistics of historical data server side,
+	so clients do not need to download full histories.
+
+	The selected attributes are read from the cursor into typed arrays,
+	one column per attribute, and every statistic is then computed over
+	the NumPy columns. Missing and non numeric values are NaN and are
+	left out of the statistics. Times are naive UTC, read as milliseconds
+	since the epoch with a mask of the readings that have one.
+	"""
+
+	epoch = datetime(1970, 1, 1)
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Analytics Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["stats"]
+		self.timeField = self.helpers.confs["data"]["timeField"]
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def prepare(self, arguments):
+		""" Reads the statistics parameters.
+
+		Raises ValueError if they are invalid.
+		"""
+
+		attrs = arguments.get('attrs').split(",") if arguments.get('attrs') is not None else []
+		if not len(attrs) or "*" in attrs:
+			raise ValueError("stats requires a list of attrs")
+
+		percentiles = self.confs["percentiles"]
+		if arguments.get('percentiles') is not None:
+			percentiles = [float(p) for p in arguments.get('percentiles').split(",")]
+		if not all(0 <= p <= 100 for p in percentiles):
+			raise ValueError("percentiles must be between 0 and 100")
+
+		bins = int(arguments.get('bins', self.confs["bins"]))
+		window = int(arguments.get('window', self.confs["window"]))
+		if bins < 1 or window < 1:
+			raise ValueError("bins and window must be positive")
+
+		return attrs, percentiles, bins, window
+
+	def columns(self, documents, attrs):
+		""" Reads the time field and attributes of documents into arrays. """
+
+		times = array.array("q")
+		timed = array.array("b")
+		values = [array.array("d") for attr in attrs]
+		nan = float("nan")
+
+		for document in documents:
+			time = document.get(self.timeField)
+			if isinstance(time, datetime):
+				# utctimetuple leaves naive times as they are, as UTC
+				times.append(calendar.timegm(time.utctimetuple()) * 1000 + time.microsecond // 1000)
+				timed.append(1)
+			else:
+				times.append(0)
+				timed.append(0)
+			for i, attr in enumerate(attrs):
+				value = document.get(attr)
+				if isinstance(value, dict):
+					value = value.get("value")
+				if isinstance(value, (int, float)) and not isinstance(value, bool):
+					values[i].append(value)
+				else:
+					values[i].append(nan)
+
+		return np.frombuffer(times, dtype=np.int64), np.frombuffer(timed, dtype=np.int8) == 1, \
+			[np.frombuffer(column, dtype=np.float64) for column in values]
+
+	def summarize(self, documents, attrs, percentiles, bins, window):
+		""" Computes the summary statistics of the attributes of documents. """
+
+		times, timed, columns = self.columns(documents, attrs)
+
+		# Rolling means follow time order, whatever order documents came in,
+		# with readings without a time first
+		order = np.lexsort((times, timed))
+		summary = {"Count": len(times)}
+
+		for attr, column in zip(attrs, columns):
+			valid = column[~np.isnan(column)]
+			stats = {"count": int(len(valid))}
+
+			if len(valid):
+				counts, edges = np.histogram(valid, bins=bins)
+				stats.update({
+					"mean": float(valid.mean()),
+					"std": float(valid.std()),
+					"min": float(valid.min()),
+					"max": float(valid.max()),
+					"percentiles": {("%g" % p): float(value) for p, value in
+						zip(percentiles, np.percentile(valid, percentiles))},
+					"histogram": {
+						"counts": counts.tolist(),
+						"edges": edges.tolist()
+					},
+					"rollingMean": self.rolling(times[order], timed[order], column[order], window)
+				})
+
+			summary[attr] = stats
+
+		return summary
+
+	def rolling(self, times, timed, column, window):
+		""" Computes a rolling mean over window readings.
+
+		The series is thinned to at most stats.points evenly spaced points,
+		as [time, mean] pairs.
+		"""
+
+		keep = ~np.isnan(column)
+		means = pd.Series(column[keep]).rolling(window, min_periods=1).mean().to_numpy()
+		times = times[keep]
+		timed = timed[keep]
+
+		step = max(1, int(np.ceil(len(means) / self.confs["points"])))
+		indices = np.arange(len(means) - 1, -1, -step)[::-1]
+
+		return [[self.epoch + timedelta(milliseconds=int(times[i])) if timed[i] else None,
+				float(means[i])] for i in indices]
@@ -30,13 +30,18 @@ Contributors:
 
 """
 
+import base64
+import bson
 import json
 import requests
 
 import pandas as pd
 
 from bson import json_util, ObjectId
-from flask import Response
+from datetime import datetime, timezone
+from flask import has_request_context, request, Response, stream_with_context
+
+from modules.compression import compression
 
 class broker():
 	""" HIASHDI Historical Broker Module.
@@ -51,6 +56,7 @@ class broker():
 		self.program = "HIASHDI Helper Module"
 
 		self.mongodb = mongodb
+		self.compression = compression(self.helpers)
 
 		self.headers = {
 			"content-type": self.helpers.confs["contentType"]
@@ -109,6 +115,35 @@ class broker():
 
 		return response
 
+	def checkBatchBody(self, payload):
+		""" Checks a batch request body is valid.
+
+		Accepts a JSON array of objects, or NDJSON with one JSON object
+		per line.
+		"""
+
+		response = False
+		message = "valid"
+
+		body = payload.get_data(as_text=True).strip()
+
+		try:
+			if body.startswith("["):
+				response = json.loads(body)
+			else:
+				response = [json.loads(line) for line in body.splitlines()
+								if line.strip() != ""]
+			if not isinstance(response, list) or not len(response):
+				response = False
+				message = "invalid"
+		except ValueError:
+			response = False
+			message = "invalid"
+
+		self.helpers.logger.info("Request batch data " + message)
+
+		return response
+
 	def checkBool(self, value):
 		""" Checks if a value is a bool. """
 
@@ -143,6 +178,104 @@ class broker():
 
 		return val
 
+	def now(self):
+		""" Gets the current time as naive UTC, as times are stored. """
+
+		return datetime.now(timezone.utc).replace(tzinfo=None)
+
+	def castTime(self, val):
+		""" Casts an ISO 8601 date or date time, or a datetime, to a datetime.
+
+		Times are naive UTC, as HIASHDI stores them and MongoDB returns them,
+		so times with an offset are converted to UTC and those without one
+		are taken as UTC. Raises ValueError if the value is not ISO 8601.
+		"""
+
+		if not isinstance(val, datetime):
+			val = val.strip()
+			if val.endswith("Z") or val.endswith("z"):
+				val = val[:-1] + "+00:00"
+			val = datetime.fromisoformat(val)
+
+		if val.tzinfo is not None:
+			val = val.astimezone(timezone.utc).replace(tzinfo=None)
+
+		return val
+
+	def cursorSort(self, sort):
+		""" Adds the _id tie breaker that keyset pagination relies on. """
+
+		if "_id" in [key for key, direction in sort]:
+			return list(sort)
+
+		return list(sort) + [("_id", 1)]
+
+	def cursorValue(self, entity, key):
+		""" Gets the value of a possibly dotted sort key from a document. """
+
+		for part in key.split("."):
+			if not isinstance(entity, dict):
+				return None
+			entity = entity.get(part)
+
+		return entity
+
+	def encodeCursor(self, sort, entity):
+		""" Creates an opaque continuation token for the last document of a page.
+
+		The token holds the sort specification and the sort key values of
+		the document, BSON encoded so dates and ObjectIds survive.
+		"""
+
+		token = bson.encode({
+			"s": [[key, direction] for key, direction in sort],
+			"v": [self.cursorValue(entity, key) for key, direction in sort]
+		})
+
+		return base64.urlsafe_b64encode(token).decode("ascii").rstrip("=")
+
+	def cursorFilter(self, token, sort):
+		""" Converts a continuation token into a range filter.
+
+		Documents after the token are those greater on the first sort key,
+		or equal on it and greater on the next, and so on, with "greater"
+		meaning "less" for descending keys. Missing values sort before
+		everything else, as they do in MongoDB.
+
+		Raises ValueError if the token is malformed or was created for a
+		different sort.
+		"""
+
+		try:
+			cursor = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+		except Exception:
+			raise ValueError("Invalid cursor")
+
+		if cursor.get("s") != [[key, direction] for key, direction in sort] or \
+				len(cursor.get("v", [])) != len(sort):
+			raise ValueError("Cursor does not match the requested ordering")
+
+		branches = []
+		for i, (key, direction) in enumerate(sort):
+			value = cursor["v"][i]
+			equal = {sort[j][0]: cursor["v"][j] for j in range(i)}
+
+			if value is None and direction == 1:
+				after = {"$ne": None}
+			elif value is None:
+				continue
+			elif direction == 1:
+				after = {"$gt": value}
+			else:
+				after = {"$lt": value}
+
+			if value is not None and direction == -1:
+				branches.append(dict(equal, **{"$or": [{key: after}, {key: None}]}))
+			else:
+				branches.append(dict(equal, **{key: after}))
+
+		return {"$or": branches} if len(branches) else {"_id": {"$exists": False}}
+
 	def prepareResponse(self, response):
 		""" Converts response to bytes. """
 
@@ -161,6 +294,120 @@ class broker():
 
 		return response
 
+	def jsonDefault(self, value):
+		""" Converts values the json module cannot serialize.
+
+		BSON types use the MongoDB extended JSON of bson.json_util, and
+		other iterables such as pymongo cursors become lists.
+		"""
+
+		try:
+			return json_util.default(value)
+		except TypeError:
+			if hasattr(value, "__iter__") and not isinstance(value, (str, bytes)):
+				return list(value)
+			raise
+
+	def pretty(self):
+		""" Whether the current request asks for indented JSON. """
+
+		if self.helpers.confs["responses"]["pretty"]:
+			return True
+
+		return has_request_context() and "pretty" in \
+			request.args.get("options", "").split(",")
+
+	def encode(self, response, pretty=False):
+		""" Serializes a response body, including BSON types, in one pass.
+
+		The output is compact unless pretty is set.
+		"""
+
+		if pretty:
+			return json.dumps(response, default=self.jsonDefault, indent=4)
+
+		return json.dumps(response, default=self.jsonDefault, separators=(",", ":"))
+
+	def prepend(self, first, documents):
+		""" Yields a document already read, then the rest of its cursor.
+
+		Unlike itertools.chain, closing the result closes the cursor.
+		"""
+
+		try:
+			yield first
+			yield from documents
+		finally:
+			if hasattr(documents, "close"):
+				documents.close()
+
+	def stream(self, responseCode, documents, headers={}, ndjson=False):
+		""" Builds a streamed response from an iterable of documents.
+
+		Documents are serialized as they are read, chunkSize at a time, as a
+		JSON array or as NDJSON with one document per line, so memory use
+		does not grow with the number of documents.
+		"""
+
+		chunkSize = self.helpers.confs["streaming"]["chunkSize"]
+		separator = "\n" if ndjson else ","
+
+		def generate():
+			started = False
+			chunk = []
+			try:
+				if not ndjson:
+					yield "["
+				for document in documents:
+					chunk.append(self.encode(document))
+					if len(chunk) >= chunkSize:
+						yield (separator if started and not ndjson else "") + \
+							separator.join(chunk) + ("\n" if ndjson else "")
+						started = True
+						chunk = []
+				if len(chunk):
+					yield (separator if started and not ndjson else "") + \
+						separator.join(chunk) + ("\n" if ndjson else "")
+				if not ndjson:
+					yield "]"
+			finally:
+				if hasattr(documents, "close"):
+					documents.close()
+
+		mimetype = "application/x-ndjson" if ndjson else "application/json"
+		response = Response(stream_with_context(generate()), status=responseCode,
+						mimetype=mimetype)
+		headers['Content-Type'] = mimetype
+		response.headers = headers
+
+		return response
+
+	def streamBytes(self, responseCode, chunks, headers={}, mimetype="application/octet-stream"):
+		""" Builds a streamed response from an iterable of byte chunks. """
+
+		response = Response(stream_with_context(chunks), status=responseCode,
+						mimetype=mimetype)
+		headers['Content-Type'] = mimetype
+		response.headers = headers
+
+		return response
+
+	def respondBytes(self, responseCode, body, headers={}):
+		""" Builds a response from an already serialized body. """
+
+		response = Response(response=body, status=responseCode)
+		response.headers = headers
+
+		return response
+
+	def notModified(self, headers={}):
+		""" Builds a 304 Not Modified response, which has no body. """
+
+		response = Response(status=304)
+		response.headers = headers
+
+		return response
+
 	def respond(self, responseCode, response, headers={},
 				override = False, accepted = []):
 		""" Builds the request repsonse """
@@ -178,8 +425,8 @@ class broker():
 				return_as = "text"
 
 		if return_as == "json":
-			response =  Response(response=json.dumps(json.loads(json_util.dumps(response)),
-											indent=4), status=responseCode, mimetype="application/json")
+			response =  Response(response=self.encode(response, self.pretty()),
+								status=responseCode, mimetype="application/json")
 			headers['Content-Type'] = 'application/json'
 		elif return_as == "text":
 			if "text/plain" not in accepted:
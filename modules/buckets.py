@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+""" HIASHDI Time Series Buckets Module.
+
+This module provides the bucketed time series storage layout for
+historical readings. Readings are stored either in MongoDB native time
+series collections, or grouped per entity and time window into bucket
+documents.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import re
+import threading
+import time
+
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from bson.son import SON
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from modules.codec import codec
+
+
+class buckets():
+	""" HIASHDI Time Series Buckets Module.
+
+	This module provides the bucketed time series storage layout for
+	historical readings. Readings are stored either in MongoDB native time
+	series collections, or grouped per entity and time window into bucket
+	documents.
+
+	In timeseries mode MongoDB does the bucketing and reads need no
+	changes. In buckets mode each type's readings are stored in a
+	<Collection>Buckets collection, with documents of the form:
+
+		{"<entityField>": ..., "Start": ..., "End": ..., "Count": ...,
+			"Readings": [...]}
+
+	Reads unwind the buckets and union the original collection, so
+	readings stored before buckets were enabled are still returned.
+
+	When compression is enabled, buckets whose window has closed are
+	rewritten as compressed columns by the codec module. Compressed buckets
+	are decoded and filtered here rather than in MongoDB.
+	"""
+
+	epoch = datetime(1970, 1, 1)
+
+	def __init__(self, helpers, mongodb, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Time Series Buckets Module"
+
+		self.mongodb = mongodb
+		self.data = data
+
+		self.confs = self.helpers.confs["buckets"]
+		self.timeField = self.helpers.confs["data"]["timeField"]
+		self.entityField = self.helpers.confs["data"]["entityField"]
+
+		self.codec = codec(self.confs["compress"]["level"])
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Prepares the collections of the bucketed types. """
+
+		if self.confs["mode"] == "timeseries":
+			self.createTimeSeries()
+		else:
+			for typeof in self.confs["types"]:
+				collection = self.getBuckets(typeof)
+				collection.create_index([(self.entityField, ASCENDING),
+					("Start", ASCENDING)], background=True)
+				collection.create_index("Readings._id", background=True)
+				for field in ["Start", "End"]:
+					collection.create_index(field, background=True,
+						partialFilterExpression={"Compressed": True})
+			if self.confs["compress"]["enabled"]:
+				threading.Thread(target=self.compressor, args=(), daemon=True).start()
+
+		self.helpers.logger.info(self.program + " started in " + \
+			self.confs["mode"] + " mode.")
+
+	def createTimeSeries(self):
+		""" Creates native time series collections where supported.
+
+		Existing collections cannot be converted and are left as they are.
+		"""
+
+		version = self.mongodb.mongoCon.server_info()["versionArray"]
+		if version[0] < 5:
+			self.helpers.logger.warning(self.program + \
+				" MongoDB 5.0 or later is required for time series collections")
+			return
+
+		existing = self.mongodb.mongoConn.list_collection_names()
+
+		for typeof in self.confs["types"]:
+			name = self.data.getCollection(typeof).name
+			if name in existing:
+				self.helpers.logger.warning(self.program + " " + name + \
+					" already exists and is not a time series collection")
+				continue
+			self.mongodb.mongoConn.create_collection(name, timeseries={
+				"timeField": self.timeField,
+				"metaField": self.entityField,
+				"granularity": self.confs["granularity"]
+			})
+			self.helpers.logger.info(self.program + " created time series collection " + name)
+
+	def isBucketed(self, typeof):
+		""" Whether a type is stored in bucket documents. """
+
+		return self.confs["mode"] == "buckets" and typeof in self.confs["types"]
+
+	def applies(self, typeof):
+		""" Whether a type uses either time series layout. """
+
+		return typeof in self.confs["types"]
+
+	def getBuckets(self, typeof):
+		""" Gets the bucket collection of a type. """
+
+		return self.mongodb.mongoConn[self.data.getCollection(typeof).name + "Buckets"]
+
+	def timestamp(self, entry):
+		""" Makes sure an entry has a datetime in the time field.
+
+		ISO 8601 times and datetimes are converted to naive UTC, and numbers
+		are taken as epoch seconds, or milliseconds from 1e11 on. Entries
+		without a time get the current time. Raises ValueError for any
+		other time.
+		"""
+
+		value = entry.get(self.timeField)
+		if isinstance(value, datetime) and value.tzinfo is None:
+			return value
+
+		if value is None:
+			value = self.data.broker.now()
+		elif isinstance(value, (int, float)) and not isinstance(value, bool):
+			try:
+				value = self.epoch + timedelta(
+					milliseconds=value if abs(value) >= 1e11 else value * 1000)
+			except OverflowError:
+				raise ValueError("Time out of range: " + str(value))
+		elif isinstance(value, (datetime, str)):
+			value = self.data.broker.castTime(value)
+		else:
+			raise ValueError("Invalid Time: " + str(value))
+
+		entry[self.timeField] = value
+		return value
+
+	def window(self, time):
+		""" Gets the start of the bucket window a time falls in. """
+
+		# Times are naive UTC, so they are not converted from local time
+		seconds = int((time - self.epoch).total_seconds())
+		return self.epoch + timedelta(seconds=seconds - seconds % self.confs["window"])
+
+	def insert(self, typeof, datas):
+		""" Pushes readings into their buckets.
+
+		Readings for the same bucket are pushed with a single update. Returns
+		the write errors with the index of the reading they apply to.
+		"""
+
+		groups = {}
+
+		for i, entry in enumerate(datas):
+			if "_id" not in entry:
+				entry["_id"] = ObjectId()
+			key = (str(entry.get(self.entityField)), self.window(self.timestamp(entry)))
+			groups.setdefault(key, []).append(i)
+
+		operations = []
+		positions = []
+
+		for key, indexes in groups.items():
+			for i in range(0, len(indexes), self.confs["maxSize"]):
+				chunk = indexes[i:i + self.confs["maxSize"]]
+				readings = [datas[index] for index in chunk]
+				operations.append(UpdateOne({
+					self.entityField: readings[0].get(self.entityField),
+					"Start": key[1],
+					"Count": {"$lte": self.confs["maxSize"] - len(chunk)},
+					"Compressed": {"$ne": True}
+				}, {
+					"$push": {"Readings": {"$each": readings}},
+					"$inc": {"Count": len(chunk)},
+					"$max": {"End": max(r[self.timeField] for r in readings)}
+				}, upsert=True))
+				positions.append(chunk)
+
+		errors = []
+
+		try:
+			self.getBuckets(typeof).bulk_write(operations, ordered=False)
+		except BulkWriteError as e:
+			for error in e.details["writeErrors"]:
+				for index in positions[error["index"]]:
+					errors.append(dict(error, index=index))
+
+		return errors
+
+	def compressor(self):
+		""" Compresses closed buckets every compress.interval seconds. """
+
+		while True:
+			time.sleep(self.confs["compress"]["interval"])
+			for typeof in self.confs["types"]:
+				try:
+					self.compress(typeof)
+				except Exception as e:
+					self.helpers.logger.error(self.program + " " + typeof + \
+						" compression failed: " + str(e))
+
+	def compress(self, typeof):
+		""" Rewrites the closed buckets of a type as compressed columns. """
+
+		collection = self.getBuckets(typeof)
+		closed = self.window(self.data.broker.now()) - timedelta(seconds=self.confs["window"])
+		compressed = 0
+
+		for bucket in collection.find({"Compressed": {"$ne": True}, "Start": {"$lte": closed}}):
+			columns, rest, order = self.codec.encode(bucket["Readings"], self.timeField)
+			ids = [reading["_id"] for reading in bucket["Readings"]]
+			result = collection.update_one({
+				"_id": bucket["_id"],
+				"Count": bucket["Count"],
+				"Compressed": {"$ne": True}
+			}, {
+				"$set": {
+					"Compressed": True,
+					"Columns": columns,
+					"Rest": rest,
+					"Order": order,
+					"MinId": min(ids),
+					"MaxId": max(ids)
+				},
+				"$unset": {"Readings": ""}
+			})
+			compressed += result.modified_count
+
+		if compressed:
+			self.helpers.logger.info(self.program + " compressed " + \
+				str(compressed) + " " + typeof + " buckets")
+
+	def match(self, query, compressed=False):
+		""" Builds the bucket level filter for a reading query.
+
+		Reading ids, entity equality and time ranges are pushed down so only
+		the buckets that can hold matching readings are unwound or decoded.
+		"""
+
+		match = {"Compressed": True} if compressed else {"Compressed": {"$ne": True}}
+
+		if "_id" in query and compressed:
+			if isinstance(query["_id"], ObjectId):
+				match["MinId"] = {"$lte": query["_id"]}
+				match["MaxId"] = {"$gte": query["_id"]}
+		elif "_id" in query:
+			match["Readings._id"] = query["_id"]
+
+		if self.entityField in query:
+			match[self.entityField] = query[self.entityField]
+
+		if isinstance(query.get(self.timeField), dict):
+			condition = query[self.timeField]
+			for operator in ["$gt", "$gte"]:
+				if operator in condition:
+					match["End"] = {"$gte": condition[operator]}
+			for operator in ["$lt", "$lte"]:
+				if operator in condition:
+					match["Start"] = {"$lte": condition[operator]}
+
+		return match
+
+	def pipeline(self, typeof, query, fields=None, sort=[], offset=0, limit=0):
+		""" Builds the aggregation pipeline returning individual readings. """
+
+		pipeline = [
+			{"$match": self.match(query)},
+			{"$unwind": "$Readings"},
+			{"$replaceRoot": {"newRoot": "$Readings"}},
+			{"$match": query},
+			{"$unionWith": {
+				"coll": self.data.getCollection(typeof).name,
+				"pipeline": [{"$match": query}]
+			}}
+		]
+
+		if len(sort):
+			pipeline.append({"$sort": SON(sort)})
+		if offset:
+			pipeline.append({"$skip": offset})
+		if limit:
+			pipeline.append({"$limit": limit})
+		if fields is not None:
+			pipeline.append({"$project": fields})
+
+		return pipeline
+
+	def find(self, typeof, query, fields=None, sort=[], offset=0, limit=0):
+		""" Finds individual readings of a bucketed type. """
+
+		readings = self.decompress(typeof, query, sort, offset + limit if limit else 0)
+		if not len(readings):
+			return self.getBuckets(typeof).aggregate(
+				self.pipeline(typeof, query, fields, sort, offset, limit), allowDiskUse=True)
+
+		readings += list(self.getBuckets(typeof).aggregate(
+			self.pipeline(typeof, query, None, sort, 0, offset + limit if limit else 0),
+			allowDiskUse=True))
+
+		for field, direction in reversed(sort):
+			readings.sort(key=lambda reading: self.sortKey(reading, field),
+				reverse=direction == -1)
+
+		readings = readings[offset:offset + limit if limit else None]
+
+		if fields is not None:
+			readings = [self.project(reading, fields) for reading in readings]
+
+		return readings
+
+	def count(self, typeof, query):
+		""" Counts the individual readings of a bucketed type. """
+
+		result = list(self.getBuckets(typeof).aggregate(
+			self.pipeline(typeof, query) + [{"$count": "Count"}], allowDiskUse=True))
+
+		compressed = 0
+		for bucket in self.getBuckets(typeof).find(self.match(query, True)):
+			compressed += sum(1 for reading in
+				self.codec.decode(bucket["Columns"], bucket["Rest"], bucket.get("Order"))
+				if self.matches(reading, query))
+
+		return compressed + \
+			(result[0]["Count"] if len(result) else 0)
+
+	def decompress(self, typeof, query, sort=[], needed=0):
+		""" Decodes the compressed buckets that can hold matching readings,
+		and returns the matching readings.
+
+		When only the first needed readings are wanted, unsorted or sorted by
+		time alone, buckets are scanned in time order and decoding stops once
+		no later bucket can hold a reading that sorts before them.
+
+		Otherwise every matching reading is held in memory, so ValueError is
+		raised once there are more than maxDecoded of them.
+		"""
+
+		cursor = self.getBuckets(typeof).find(self.match(query, True))
+		ordered = needed and needed <= self.confs["maxDecoded"] and \
+			(not len(sort) or [field for field, _ in sort] == [self.timeField])
+
+		if ordered and len(sort):
+			direction = sort[0][1]
+			cursor = cursor.sort("Start" if direction == 1 else "End", direction)
+
+		readings = []
+
+		for bucket in cursor:
+			if ordered and len(readings) >= needed:
+				if not len(sort):
+					break
+				# Later buckets only hold readings at or after this bound
+				bound = bucket["Start"] if direction == 1 else bucket["End"]
+				first = sum(1 for reading in readings if
+					(reading[self.timeField] < bound if direction == 1 else reading[self.timeField] > bound))
+				if first >= needed:
+					break
+			readings.extend(reading for reading in
+				self.codec.decode(bucket["Columns"], bucket["Rest"], bucket.get("Order"))
+				if self.matches(reading, query))
+			if not ordered and len(readings) > self.confs["maxDecoded"]:
+				cursor.close()
+				raise ValueError("More than " + str(self.confs["maxDecoded"]) + \
+					" compressed readings match, set a limit ordered by " + self.timeField)
+
+		cursor.close()
+
+		return readings
+
+	def resolve(self, reading, path):
+		""" Gets a dotted path from a reading, or a missing marker. """
+
+		value = reading
+		for key in path.split("."):
+			if not isinstance(value, dict) or key not in value:
+				return self
+			value = value[key]
+
+		return value
+
+	def matches(self, reading, query):
+		""" Whether a decoded reading matches a MongoDB query.
+
+		Supports the operators the HIASHDI query parameters produce.
+		"""
+
+		for key, condition in query.items():
+			if key == "$and":
+				if not all(self.matches(reading, sub) for sub in condition):
+					return False
+			elif key == "$or":
+				if not any(self.matches(reading, sub) for sub in condition):
+					return False
+			elif key == "$nor":
+				if any(self.matches(reading, sub) for sub in condition):
+					return False
+			elif not self.condition(self.resolve(reading, key), condition):
+				return False
+
+		return True
+
+	def condition(self, value, condition):
+		""" Whether a value matches a field condition. """
+
+		if not isinstance(condition, dict) or not len(condition) or \
+				not all(operator.startswith("$") for operator in condition):
+			return self.equals(value, condition)
+
+		for operator, operand in condition.items():
+			try:
+				if operator == "$in":
+					result = any(self.equals(value, item) for item in operand)
+				elif operator == "$nin":
+					result = not any(self.equals(value, item) for item in operand)
+				elif operator == "$ne":
+					result = not self.equals(value, operand)
+				elif operator == "$exists":
+					result = (value is not self) == bool(operand)
+				elif operator == "$regex":
+					result = isinstance(value, str) and re.search(operand, value) is not None
+				elif operator == "$not":
+					result = not self.condition(value, operand)
+				elif value is self:
+					result = False
+				elif operator == "$gt":
+					result = value > operand
+				elif operator == "$gte":
+					result = value >= operand
+				elif operator == "$lt":
+					result = value < operand
+				elif operator == "$lte":
+					result = value <= operand
+				else:
+					result = False
+			except TypeError:
+				result = False
+
+			if not result:
+				return False
+
+		return True
+
+	def equals(self, value, operand):
+		""" Whether a value equals an operand, matching array elements. """
+
+		if value is self:
+			return operand is None
+		if isinstance(value, list) and not isinstance(operand, list):
+			return operand in value
+		return value == operand
+
+	def sortKey(self, reading, field):
+		""" Sort key that orders missing values first and groups types. """
+
+		value = self.resolve(reading, field)
+		if value is self or value is None:
+			return (0, 0)
+		if isinstance(value, (int, float)) and not isinstance(value, bool):
+			return (1, value)
+		if isinstance(value, str):
+			return (2, value)
+		if isinstance(value, datetime):
+			return (4, value)
+		return (3, str(value))
+
+	def project(self, reading, fields):
+		""" Applies a find projection to a decoded reading. """
+
+		included = [field for field, show in fields.items() if show and field != "_id"]
+
+		if len(included):
+			projected = {field: reading[field] for field in included if field in reading}
+			if fields.get("_id", True) and "_id" in reading:
+				projected["_id"] = reading["_id"]
+			return projected
+
+		return {field: value for field, value in reading.items()
+					if fields.get(field, True)}
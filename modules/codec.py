@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+""" HIASHDI Numeric Series Codec Module.
+
+This module compresses the timestamps and numeric values of bucketed
+readings into columns, and decodes them with vectorized NumPy operations.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import zlib
+
+import numpy as np
+
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from datetime import datetime
+
+
+class codec():
+	""" HIASHDI Numeric Series Codec Module.
+
+	This module compresses the timestamps and numeric values of bucketed
+	readings into columns, and decodes them with vectorized NumPy operations.
+
+	The encodings follow the ideas of Gorilla, adapted so decoding needs no
+	bit level loops:
+
+	- Timestamps are stored as delta-of-deltas of their milliseconds, in the
+	  smallest integer width that holds them. At a fixed cadence these are
+	  almost all zero. Decoding is two cumulative sums.
+	- Values are stored as the XOR of each float64 with the previous one,
+	  or of each int64 for series of integers so they keep their precision.
+	  For slowly changing values most of the bytes are zero. The XORed words
+	  are byte-shuffled so those zero bytes are adjacent. Decoding is a
+	  cumulative XOR. Series mixing integers and floats also store a bitmap
+	  of the integers, so they are decoded as integers again.
+
+	All columns are then deflated. Reading ids are stored the same way
+	without the XOR step, and fields with the same value in every reading
+	are stored once. The order of the fields is kept, so decoded readings
+	have their fields in the order they were written.
+	"""
+
+	minInt = -2 ** 63
+	maxInt = 2 ** 63 - 1
+	# Largest integer a float64 holds exactly
+	maxExact = 2 ** 53
+
+	def __init__(self, level=6):
+		""" Initializes the class. """
+
+		self.level = level
+
+	def pack(self, array):
+		""" Deflates an array, storing its dtype. """
+
+		return {
+			"dtype": array.dtype.str,
+			"size": len(array),
+			"data": Binary(zlib.compress(array.tobytes(), self.level))
+		}
+
+	def unpack(self, column):
+		""" Inflates an array packed by pack. """
+
+		return np.frombuffer(zlib.decompress(column["data"]), dtype=np.dtype(column["dtype"]))
+
+	def encodeTimes(self, times):
+		""" Encodes datetimes as delta-of-deltas of their milliseconds. """
+
+		ms = np.array(times, dtype="datetime64[ms]").astype(np.int64)
+		dods = np.diff(ms, n=2) if len(ms) > 2 else np.array([], dtype=np.int64)
+
+		for dtype in [np.int8, np.int16, np.int32]:
+			info = np.iinfo(dtype)
+			if not len(dods) or (dods.min() >= info.min and dods.max() <= info.max):
+				dods = dods.astype(dtype)
+				break
+
+		column = self.pack(dods)
+		column["first"] = int(ms[0]) if len(ms) else 0
+		column["delta"] = int(ms[1] - ms[0]) if len(ms) > 1 else 0
+		column["size"] = len(ms)
+
+		return column
+
+	def decodeTimes(self, column):
+		""" Decodes delta-of-deltas back to datetimes. """
+
+		size = column["size"]
+		deltas = np.empty(max(size - 1, 0), dtype=np.int64)
+		if size > 1:
+			deltas[0] = column["delta"]
+			deltas[1:] = column["delta"] + np.cumsum(self.unpack(column).astype(np.int64))
+
+		ms = np.empty(size, dtype=np.int64)
+		if size:
+			ms[0] = column["first"]
+			ms[1:] = column["first"] + np.cumsum(deltas)
+
+		return ms.astype("datetime64[ms]").tolist()
+
+	def encodeValues(self, values):
+		""" Encodes numbers as byte-shuffled XORs of consecutive 64 bit words.
+
+		Integer series are stored as int64 words, other series as float64.
+		"""
+
+		integer = all(isinstance(value, int) for value in values)
+		words = np.array(values, dtype=np.int64 if integer else np.float64).view(np.uint64)
+		xors = np.empty_like(words)
+		if len(words):
+			xors[0] = words[0]
+			xors[1:] = words[1:] ^ words[:-1]
+
+		shuffled = xors.view(np.uint8).reshape(-1, 8).T.copy()
+
+		column = self.pack(shuffled.reshape(-1))
+		column["size"] = len(values)
+		column["integer"] = integer
+		column["words"] = "int64" if integer else "float64"
+
+		ints = np.array([isinstance(value, int) for value in values], dtype=bool)
+		if not integer and ints.any():
+			column["ints"] = self.pack(np.packbits(ints))
+
+		return column
+
+	def decodeValues(self, column):
+		""" Decodes byte-shuffled XORs back to numbers. """
+
+		shuffled = self.unpack(column).reshape(8, -1)
+		xors = shuffled.T.copy().view(np.uint64).reshape(-1)
+		words = np.bitwise_xor.accumulate(xors)
+
+		if column.get("words") == "int64":
+			return words.view(np.int64).tolist()
+
+		# Columns written before int64 words stored integers as floats
+		floats = words.view(np.float64)
+		if column["integer"]:
+			return floats.astype(np.int64).tolist()
+
+		values = floats.tolist()
+		if "ints" in column:
+			ints = np.unpackbits(self.unpack(column["ints"]))[:column["size"]]
+			for i in np.flatnonzero(ints):
+				values[i] = int(values[i])
+		return values
+
+	def encodeIds(self, ids):
+		""" Encodes ObjectIds as byte-shuffled 12 byte words.
+
+		Ids generated close together share most of their bytes, so the
+		shuffled columns deflate well.
+		"""
+
+		words = np.frombuffer(b"".join(_id.binary for _id in ids), dtype=np.uint8)
+		column = self.pack(words.reshape(-1, 12).T.copy().reshape(-1))
+		column["size"] = len(ids)
+
+		return column
+
+	def decodeIds(self, column):
+		""" Decodes byte-shuffled ObjectIds. """
+
+		words = self.unpack(column).reshape(12, -1).T.tobytes()
+
+		return [ObjectId(words[i:i + 12]) for i in range(0, len(words), 12)]
+
+	def isNumeric(self, value):
+		""" Whether a value can be stored in a numeric column. """
+
+		if isinstance(value, int) and not isinstance(value, bool):
+			return self.minInt <= value <= self.maxInt
+		return isinstance(value, float)
+
+	def encode(self, readings, timeField):
+		""" Splits readings into compressed columns and remaining fields.
+
+		A top level field becomes a column when every reading has a number,
+		an ObjectId or the same value in it. Integers mixed with floats must
+		fit a float64 exactly. Everything else is kept per reading in Rest.
+
+		Also returns the order of the fields, as first seen in the readings.
+		"""
+
+		columns = {}
+
+		order = {}
+		for reading in readings:
+			order.update(dict.fromkeys(reading.keys()))
+		order = list(order)
+
+		for field in sorted(order):
+			values = [reading.get(field) for reading in readings]
+			if field == timeField and all(isinstance(value, datetime) for value in values):
+				columns[field] = self.encodeTimes(values)
+				columns[field]["kind"] = "time"
+			elif all(isinstance(value, ObjectId) for value in values):
+				columns[field] = self.encodeIds(values)
+				columns[field]["kind"] = "objectid"
+			elif all(self.isNumeric(value) for value in values) and \
+					(all(isinstance(value, int) for value in values) or
+					all(isinstance(value, float) or abs(value) <= self.maxExact for value in values)):
+				columns[field] = self.encodeValues(values)
+				columns[field]["kind"] = "value"
+			elif all(field in reading and reading[field] == values[0] for reading in readings):
+				columns[field] = {"kind": "constant", "value": values[0]}
+
+		rest = [{field: value for field, value in reading.items()
+					if field not in columns} for reading in readings]
+
+		return columns, rest, order
+
+	def decode(self, columns, rest, order=None):
+		""" Rebuilds readings from compressed columns and remaining fields,
+		with their fields in order when it is given. """
+
+		readings = [dict(fields) for fields in rest]
+
+		for field, column in columns.items():
+			if column["kind"] == "time":
+				values = self.decodeTimes(column)
+			elif column["kind"] == "objectid":
+				values = self.decodeIds(column)
+			elif column["kind"] == "constant":
+				values = [column["value"]] * len(readings)
+			else:
+				values = self.decodeValues(column)
+			for reading, value in zip(readings, values):
+				reading[field] = value
+
+		if order is None:
+			return readings
+
+		return [{field: reading[field] for field in order if field in reading}
+			for reading in readings]
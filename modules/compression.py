@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+""" HIASHDI Compression Module.
+
+This module negotiates Accept-Encoding and compresses HTTP responses,
+including streamed responses, with gzip, deflate or zstd.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+
+import zlib
+
+from werkzeug.datastructures import Headers
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+
+class compression():
+	""" HIASHDI Compression Module.
+
+	This module negotiates Accept-Encoding and compresses HTTP responses,
+	including streamed responses, with gzip, deflate or zstd.
+
+	Buffered responses are compressed in one pass when they are at least
+	minSize bytes. Streamed responses are compressed incrementally, and each
+	chunk is flushed so clients still receive documents as they are read.
+	zstd is only offered when the zstandard package is installed.
+
+	Compressed responses get a weak ETag, as their bytes differ from the
+	representation the ETag was computed over, and If-None-Match already
+	uses weak comparison.
+	"""
+
+	def __init__(self, helpers):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Compression Module"
+
+		self.confs = self.helpers.confs["compression"]
+
+		self.encodings = [encoding for encoding in self.confs["encodings"]
+					if encoding != "zstd" or zstandard is not None]
+
+		self.helpers.logger.info(self.program + " initialization complete, encodings: " + \
+			", ".join(self.encodings))
+
+	def negotiate(self, acceptEncoding):
+		""" Chooses an encoding from an Accept-Encoding header.
+
+		The encoding with the highest quality wins, ties go to the order of
+		the configured encodings. Returns None if no encoding is acceptable.
+		"""
+
+		if acceptEncoding is None or acceptEncoding.strip() == "":
+			return None
+
+		qualities = {}
+		for part in acceptEncoding.split(","):
+			name, _, parameters = part.partition(";")
+			quality = 1.0
+			for parameter in parameters.split(";"):
+				key, _, value = parameter.partition("=")
+				if key.strip().lower() == "q":
+					try:
+						quality = float(value)
+					except ValueError:
+						quality = 0.0
+			qualities[name.strip().lower()] = quality
+
+		chosen = None
+		best = 0.0
+		for encoding in self.encodings:
+			quality = qualities.get(encoding, qualities.get("*", 0.0))
+			if quality > best:
+				chosen = encoding
+				best = quality
+
+		return chosen
+
+	def compressor(self, encoding):
+		""" Creates an incremental compressor and its chunk flush mode. """
+
+		if encoding == "zstd":
+			return zstandard.ZstdCompressor(level=self.confs["zstdLevel"]).compressobj(), \
+				zstandard.COMPRESSOBJ_FLUSH_BLOCK
+
+		# gzip uses a gzip wrapper, HTTP deflate uses a zlib wrapper
+		wbits = 31 if encoding == "gzip" else 15
+
+		return zlib.compressobj(self.confs["level"], zlib.DEFLATED, wbits), zlib.Z_SYNC_FLUSH
+
+	def encode(self, body, encoding):
+		""" Compresses a complete body. """
+
+		compressor, _ = self.compressor(encoding)
+
+		return compressor.compress(body) + compressor.flush()
+
+	def generate(self, chunks, encoding):
+		""" Compresses an iterable of chunks as it is read. """
+
+		compressor, flush = self.compressor(encoding)
+
+		try:
+			for chunk in chunks:
+				if isinstance(chunk, str):
+					chunk = chunk.encode("utf-8")
+				if not chunk:
+					continue
+				compressed = compressor.compress(chunk) + compressor.flush(flush)
+				if compressed:
+					yield compressed
+			yield compressor.flush()
+		finally:
+			if hasattr(chunks, "close"):
+				chunks.close()
+
+	def compress(self, response, acceptEncoding):
+		""" Compresses a response for the encodings a client accepts. """
+
+		if not self.confs["enabled"]:
+			return response
+
+		if response.status_code < 200 or response.status_code in [204, 304] \
+				or response.direct_passthrough:
+			return response
+
+		# Broker responses assign plain dicts as headers
+		if not isinstance(response.headers, Headers):
+			response.headers = Headers(response.headers)
+
+		if "Content-Encoding" in response.headers \
+				or response.mimetype in self.confs["skipTypes"]:
+			return response
+
+		# The representation depends on Accept-Encoding from here on
+		response.vary.add("Accept-Encoding")
+
+		encoding = self.negotiate(acceptEncoding)
+		if encoding is None:
+			return response
+
+		if response.is_streamed:
+			response.response = self.generate(response.response, encoding)
+			response.headers.pop("Content-Length", None)
+		else:
+			body = response.get_data()
+			if len(body) < self.confs["minSize"]:
+				return response
+			response.set_data(self.encode(body, encoding))
+
+		response.headers["Content-Encoding"] = encoding
+
+		etag = response.headers.get("ETag")
+		if etag is not None and not etag.startswith("W/"):
+			response.headers["ETag"] = "W/" + etag
+
+		return response
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+""" HIASHDI Counts Module.
+
+This module counts the documents matching data listing filters, caching
+the counts for a short time.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class counts():
+	""" HIASHDI Counts Module.
+
+	This module counts the documents matching data listing filters, caching
+	the counts for a short time.
+
+	Unfiltered counts use the collection metadata through
+	estimated_document_count, and filtered counts use count_documents,
+	hinted with the full index whose leading keys best cover the filter.
+
+	Counts are cached per type and normalized filter for counts.ttl
+	seconds. Each cached count records the write generation of its type's
+	collection, so any write to it makes the cached counts stale at once.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Counts Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["counts"]
+
+		self.cache = OrderedDict()
+		self.indexes = {}
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def key(self, typeof, query):
+		""" Cache key of a type and filter, equal for equal filters. """
+
+		return typeof + json.dumps(query, sort_keys=True,
+			default=self.data.broker.jsonDefault)
+
+	def count(self, typeof, query):
+		""" Counts the documents of a type matching a filter. """
+
+		key = self.key(typeof, query)
+		generation = self.data.generation(self.data.getCollection(typeof).name)
+
+		with self.lock:
+			if key in self.cache:
+				cached = self.cache[key]
+				if cached[0] == generation and cached[1] > time.time():
+					self.cache.move_to_end(key)
+					self.hits += 1
+					return cached[2]
+			self.misses += 1
+
+		result = self.counter(typeof, query)
+
+		with self.lock:
+			self.cache[key] = (generation, time.time() + self.confs["ttl"], result)
+			self.cache.move_to_end(key)
+			if len(self.cache) > self.confs["cacheSize"]:
+				self.cache.popitem(last=False)
+
+		return result
+
+	def counter(self, typeof, query):
+		""" Counts the documents of a type matching a filter in MongoDB. """
+
+		if self.data.buckets is not None and self.data.buckets.isBucketed(typeof):
+			return self.data.buckets.count(typeof, query)
+
+		collection = self.data.getCollection(typeof)
+
+		if not len(query):
+			return collection.estimated_document_count()
+
+		hint = self.hint(typeof, collection, query) if self.confs["hints"] else None
+		if hint is not None:
+			return collection.count_documents(query, hint=hint)
+
+		return collection.count_documents(query)
+
+	def hint(self, typeof, collection, query):
+		""" Gets the plain B-tree index over every document whose leading keys
+		cover most of a filter.
+
+		Index definitions are cached for counts.indexTtl seconds.
+		"""
+
+		with self.lock:
+			cached = self.indexes.get(typeof)
+
+		if cached is None or cached[0] < time.time():
+			cached = (time.time() + self.confs["indexTtl"], collection.index_information())
+			with self.lock:
+				self.indexes[typeof] = cached
+
+		fields = [field for field in query if not field.startswith("$")]
+
+		best = None
+		covered = 0
+		for name, index in cached[1].items():
+			# Sparse and partial indexes leave out documents, so counting
+			# through them would undercount
+			if index.get("sparse") or "partialFilterExpression" in index:
+				continue
+			# Hashed, text, geospatial and wildcard indexes cannot be
+			# hinted for any filter, only plain B-tree indexes are used
+			if not all(direction in [1, -1] and not key.endswith("$**")
+					for key, direction in index["key"]):
+				continue
+			keys = [key for key, direction in index["key"]]
+			prefix = 0
+			while prefix < len(keys) and keys[prefix] in fields:
+				prefix += 1
+			if prefix > covered:
+				best = name
+				covered = prefix
+
+		return best
+
+	def stats(self):
+		""" Returns the count cache counters. """
+
+		with self.lock:
+			return {
+				"Size": len(self.cache),
+				"Hits": self.hits,
+				"Misses": self.misses
+			}
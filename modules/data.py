@@ -36,9 +36,28 @@ import json
 import jsonpickle
 import os
 import sys
+import threading
+import time
 
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
 from mgoquery import Parser
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from modules.aggregation import aggregation
+from modules.analytics import analytics
+from modules.buckets import buckets
+from modules.counts import counts
+from modules.dedupe import dedupe
+from modules.entities import entities
+from modules.export import export
+from modules.fanout import fanout
+from modules.groupcommit import groupcommit
+from modules.indexes import indexes
+from modules.latest import latest
+from modules.query import query
+from modules.results import results
+from modules.spill import spill
 
 class data():
     """ HIASHDI Data Module.
@@ -56,8 +75,77 @@ class data():
         self.mongodb = mongodb
         self.broker = broker
 
+        self.generations = {}
+        self.generationsLock = threading.Lock()
+
+        self.query = query(self.helpers, self.broker)
+        self.entities = entities(self.helpers)
+        self.counts = counts(self.helpers, self)
+        self.aggregation = aggregation(self.helpers, self)
+        self.analytics = analytics(self.helpers, self)
+        self.export = export(self.helpers, self.broker)
+        self.fanout = fanout(self.helpers, self)
+
+        self.results = None
+        if self.helpers.confs["results"]["enabled"]:
+            self.results = results(self.helpers, self)
+
+        self.indexes = None
+        if self.helpers.confs["indexes"]["enabled"]:
+            self.indexes = indexes(self.helpers, self)
+            self.indexes.start()
+
+        self.latest = None
+        if self.helpers.confs["latest"]["enabled"]:
+            self.latest = latest(self.helpers, self)
+            self.latest.start()
+
+        self.buckets = None
+        if self.helpers.confs["buckets"]["enabled"]:
+            self.buckets = buckets(self.helpers, self.mongodb, self)
+            self.buckets.start()
+
+        self.dedupe = None
+        if self.helpers.confs["idempotency"]["enabled"]:
+            self.dedupe = dedupe(self.helpers, self)
+            self.dedupe.start()
+
+        if self.helpers.confs["spill"]["enabled"] and self.buckets is not None:
+            # Replays skip entries already stored by their unique _id, which
+            # buckets and time series collections do not have
+            self.helpers.logger.error(self.program + " spill cannot be combined with buckets")
+            raise ValueError("spill cannot be combined with buckets")
+
+        self.spill = None
+        if self.helpers.confs["spill"]["enabled"]:
+            self.spill = spill(self.helpers, self.mongodb, self)
+            self.spill.start()
+
+        self.groupCommit = None
+        if self.helpers.confs["groupCommit"]["enabled"]:
+            self.groupCommit = groupcommit(self.helpers, self)
+            self.groupCommit.start()
+
         self.helpers.logger.info(self.program + " initialization complete.")
 
+    def generation(self, name):
+        """ Gets the write generation of a collection. """
+
+        return self.generations.get(name, 0)
+
+    def changed(self, name, _id=None):
+        """ Records a write to a collection, making its cached results stale.
+
+        Writes that modify an existing entry pass its id, so its cached
+        responses are removed too.
+        """
+
+        with self.generationsLock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+        if _id is not None:
+            self.entities.modified(name, _id)
+
     def getCollection(self, typeof):
 
         if typeof == "Location":
@@ -85,35 +173,14 @@ class data():
 
         return collection
 
-    def getDatas(self, arguments, accepted=[]):
-        """ Gets data from MongoDB.
+    def prepareQuery(self, arguments):
+        """ Builds the MongoDB filter of a data listing from its parameters.
 
-        You can access this endpoint by naviating your browser to https://YourServer/hiascdi/v1/data
-        If you are not logged in to the HIAS network you will be shown an authentication pop up
-        where you should provide your HIAS network user and password.
+        Raises ValueError if the q, from or to parameters cannot be parsed.
         """
 
         params = []
-        cparams = []
-        sort = []
         query = {}
-        headers = {}
-
-        collection = self.getCollection(arguments.get('type'))
-
-        count_opt = False
-        unique_opt = False
-
-        # Processes the options parameter
-        options = arguments.get('options') if arguments.get('options') is not None else None
-        if options is not None:
-            options = options.split(",")
-            for option in options:
-                unique_opt = True if option == "unique" else unique_opt
-                count_opt = True if option == "count" else count_opt
-
-        # Removes the MongoDB ID
-        fields = {}
 
         if arguments.get('use') is not None:
             # Sets a type query
@@ -149,6 +216,84 @@ class data():
                 {'$regex': arguments.get('idPattern')}
             })
 
+        if arguments.get('q') is not None:
+            # Sets a q query
+            compiled = self.query.compile(arguments.get('q'))
+
+            for key, condition in compiled.items():
+                if key == "$and":
+                    params.extend(condition)
+                elif key in query:
+                    params.append({key: condition})
+                else:
+                    query.update({key: condition})
+
+        if arguments.get('from') is not None or arguments.get('to') is not None:
+            # Sets a time range query, from is inclusive and to exclusive
+            timeRange = {}
+            if arguments.get('from') is not None:
+                timeRange["$gte"] = self.broker.castTime(arguments.get('from'))
+            if arguments.get('to') is not None:
+                timeRange["$lt"] = self.broker.castTime(arguments.get('to'))
+
+            timeField = self.helpers.confs["data"]["timeField"]
+            if timeField in query:
+                params.append({timeField: timeRange})
+            else:
+                query.update({timeField: timeRange})
+
+        if len(params):
+            query.update({"$and": params})
+
+        return query
+
+    def prepareSort(self, arguments):
+        """ Builds the MongoDB sort of a data listing from its orderBy. """
+
+        sort = []
+
+        # Sets the query ordering
+        if arguments.get('orderBy') is not None:
+            orders = arguments.get('orderBy').split(",")
+            for order in orders:
+                if order[0] == "!":
+                    orderBy = -1
+                    order = order[1:]
+                else:
+                    orderBy = 1
+                sort.append((order, orderBy))
+
+        return sort
+
+    def prepareLastN(self, arguments):
+        """ Gets the lastN parameter of a data listing.
+
+        Raises ValueError if it is invalid or combined with parameters that
+        change the order or position of the results.
+        """
+
+        if arguments.get('lastN') is None:
+            return None
+
+        lastN = int(arguments.get('lastN'))
+        if lastN < 1:
+            raise ValueError("lastN must be a positive integer")
+
+        for parameter in ["orderBy", "offset", "cursor", "aggrMethod"]:
+            if arguments.get(parameter) is not None:
+                raise ValueError("lastN cannot be combined with " + parameter)
+
+        return lastN
+
+    def prepareFields(self, arguments):
+        """ Builds the MongoDB projection of a data listing from its attrs.
+
+        Returns the projection and the list of requested attributes.
+        """
+
+        # Removes the MongoDB ID
+        fields = {}
+
         attribs = []
         if arguments.get('attrs') is not None:
             # Sets a attrs query
@@ -165,103 +310,188 @@ class data():
                 for attr in attribs:
                     fields.update({attr: True})
 
-        if arguments.get('q') is not None:
-            print(arguments.get('q'))
-            # Sets a q query
-            qs = arguments.get('q').split(";")
-            for q in qs:
-                if "||" in q:
-                    qor = q.split("||")
-                    ors = []
-                    for qori in qor:
-                        if "==" in qori:
-                            qp = qori.split("==")
-                            ors.append({qp[0]:
-                                {'$in': [self.broker.cast(qp[1])]}
-                            })
-                        elif  ":" in qori:
-                            qp = qori.split(":")
-                            ors.append({qp[0]:
-                                {'$in': [self.broker.cast(qp[1])]}
-                            })
-                        elif "!=" in qori:
-                            qp = qori.split("!=")
-                            ors.append({qp[0]:
-                                {'$ne': self.broker.cast(qp[1])}
-                            })
-                        elif ">=" in qori:
-                            qp = qori.split(">=")
-                            ors.append({qp[0]:
-                                {'$gte': self.broker.cast(qp[1])}
-                            })
-                        elif "<=" in qori:
-                            qp = qori.split("<=")
-                            ors.append({qp[0]:
-                                {'$lte': self.broker.cast(qp[1])}
-                            })
-                        elif "<" in qori:
-                            qp = qori.split("<")
-                            ors.append({qp[0]:
-                                {'$lt': self.broker.cast(qp[1])}
-                            })
-                        elif ">" in qori:
-                            qp = qori.split(">")
-                            ors.append({qp[0]:
-                                {'$gt': self.broker.cast(qp[1])}
-                            })
-
-                    query.update({'$or': ors })
-                    print(ors)
-
-                elif "==" in q:
-                    qp = q.split("==")
-                    query.update({qp[0]:
-                        {'$in': [self.broker.cast(qp[1])]}
-                    })
-                elif  ":" in q:
-                    qp = q.split(":")
-                    query.update({qp[0]:
-                        {'$in': [self.broker.cast(qp[1])]}
-                    })
-                elif "!=" in q:
-                    qp = q.split("!=")
-                    query.update({qp[0]:
-                        {'$ne': self.broker.cast(qp[1])}
-                    })
-                elif ">=" in q:
-                    qp = q.split(">=")
-                    query.update({qp[0]:
-                        {'$gte': self.broker.cast(qp[1])}
-                    })
-                elif "<=" in q:
-                    qp = q.split("<=")
-                    query.update({qp[0]:
-                        {'$lte': self.broker.cast(qp[1])}
-                    })
-                elif "<" in q:
-                    qp = q.split("<")
-                    query.update({qp[0]:
-                        {'$lt': self.broker.cast(qp[1])}
-                    })
-                elif ">" in q:
-                    qp = q.split(">")
-                    query.update({qp[0]:
-                        {'$gt': self.broker.cast(qp[1])}
-                    })
+        return fields, attribs
 
-        if len(params):
-            query.update({"$and": params})
+    def getDatas(self, arguments, accepted=[]):
+        """ Gets data from MongoDB, or from the result cache.
 
-        # Sets the query ordering
-        if arguments.get('orderBy') is not None:
-            orders = arguments.get('orderBy').split(",")
-            for order in orders:
-                if order[0] is "!":
-                    orderBy = -1
-                    order = order[1:]
-                else:
-                    orderBy = 1
-                sort.append((order, orderBy))
+        You can access this endpoint by naviating your browser to https://YourServer/hiascdi/v1/data
+        If you are not logged in to the HIAS network you will be shown an authentication pop up
+        where you should provide your HIAS network user and password.
+        """
+
+        types = arguments.get('type').split(",")
+        if len(types) > 1:
+            return self.mergeDatas(arguments, types, accepted)
+
+        options = arguments.get('options').split(",") if arguments.get('options') is not None else []
+        if "latest" in options:
+            return self.getLatest(arguments, accepted)
+        streamed = "stream" in options or \
+            ("application/x-ndjson" in accepted and "application/json" not in accepted)
+
+        if self.results is None or streamed:
+            return self.findDatas(arguments, accepted)
+
+        typeof = arguments.get('type')
+        key = self.results.key(arguments, accepted)
+
+        response = self.results.get(typeof, key)
+        if response is not None:
+            return response
+
+        # Read before the query runs, so a write during it is not missed
+        generation = self.generation(self.getCollection(typeof).name)
+
+        response = self.findDatas(arguments, accepted)
+        self.results.put(typeof, key, generation, response)
+
+        return response
+
+    def getLatest(self, arguments, accepted=[]):
+        """ Gets the latest values of the entities of a data type. """
+
+        headers = {}
+        typeof = arguments.get('type')
+        options = arguments.get('options').split(",")
+
+        try:
+            if self.latest is None or not self.latest.applies(typeof):
+                raise ValueError("Latest values are not kept for " + typeof)
+            for parameter in ["cursor", "aggrMethod", "lastN"]:
+                if arguments.get(parameter) is not None:
+                    raise ValueError(parameter + " cannot be combined with the latest option")
+            query = self.prepareQuery(arguments)
+            offset = int(arguments.get('offset')) if arguments.get('offset') is not None else 0
+            limit = int(arguments.get('limit')) if arguments.get('limit') is not None else 0
+        except (InvalidId, ValueError) as e:
+            self.helpers.logger.info(self.program + " 400: " + str(e))
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                {}, False, accepted)
+
+        fields, attribs = self.prepareFields(arguments)
+        # The time of each attribute is only kept to order the updates
+        if '*' not in attribs:
+            fields.pop("Times", None)
+        if not len(fields) or '*' in attribs:
+            fields["Times"] = False
+        sort = self.prepareSort(arguments)
+        collection = self.latest.getCollection(typeof)
+
+        try:
+            data = collection.find(query, fields)
+            if len(sort):
+                data = data.sort(sort)
+            data = list(data.skip(offset).limit(limit))
+
+            if "count" in options:
+                headers["Count"] = collection.count_documents(query)
+        except Exception as e:
+            self.helpers.logger.info(str(e))
+            data = []
+
+        if not len(data):
+            self.helpers.logger.info(
+                self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
+
+            return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
+                                {}, False, accepted)
+
+        self.helpers.logger.info(
+            self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
+
+        return self.broker.respond(200, data, headers, False, accepted)
+
+    def mergeDatas(self, arguments, types, accepted=[]):
+        """ Gets data of several types from MongoDB, merged in time order.
+
+        The merged documents are always streamed, and are marked with the
+        type they were read from.
+        """
+
+        headers = {}
+        ndjson = "application/x-ndjson" in accepted and "application/json" not in accepted
+
+        options = arguments.get('options').split(",") if arguments.get('options') is not None else []
+
+        try:
+            direction = self.fanout.prepare(arguments, types)
+            query = self.prepareQuery(arguments)
+            lastN = self.prepareLastN(arguments)
+            offset = int(arguments.get('offset')) if arguments.get('offset') is not None else 0
+            limit = int(arguments.get('limit')) if arguments.get('limit') is not None else 0
+            if lastN is not None:
+                direction = -1
+                limit = min(limit, lastN) if limit else lastN
+        except ValueError as e:
+            self.helpers.logger.info(self.program + " 400: " + str(e))
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                {}, False, accepted)
+
+        fields, attribs = self.prepareFields(arguments)
+        fields = self.fanout.project(fields, attribs)
+
+        try:
+            # Counts first, so no cursor is left open if counting fails
+            if "count" in options:
+                headers["Count"] = self.fanout.count(types, query)
+
+            documents = self.fanout.find(types, query, fields, direction, offset, limit)
+            if lastN is not None:
+                # Puts the most recent data back in time order
+                documents = iter(list(documents)[::-1])
+
+            first = next(documents, None)
+        except Exception as e:
+            self.helpers.logger.info(str(e))
+            first = None
+
+        if first is None:
+            self.helpers.logger.info(
+                self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
+
+            return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
+                                {}, False, accepted)
+
+        self.helpers.logger.info(
+            self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
+
+        return self.broker.stream(200, self.broker.prepend(first, documents), headers, ndjson)
+
+    def findDatas(self, arguments, accepted=[]):
+        """ Gets data from MongoDB. """
+
+        cparams = []
+        headers = {}
+
+        collection = self.getCollection(arguments.get('type'))
+
+        count_opt = False
+        stream_opt = False
+        unique_opt = False
+        ndjson = "application/x-ndjson" in accepted and "application/json" not in accepted
+
+        # Processes the options parameter
+        options = arguments.get('options') if arguments.get('options') is not None else None
+        if options is not None:
+            options = options.split(",")
+            for option in options:
+                unique_opt = True if option == "unique" else unique_opt
+                stream_opt = True if option == "stream" else stream_opt
+                count_opt = True if option == "count" else count_opt
+
+        fields, attribs = self.prepareFields(arguments)
+
+        try:
+            query = self.prepareQuery(arguments)
+            lastN = self.prepareLastN(arguments)
+        except ValueError as e:
+            self.helpers.logger.info(
+                self.program + " 400: " + str(e))
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                {}, False, accepted)
+
+        sort = self.prepareSort(arguments)
 
         # Prepares the offset
         if arguments.get('offset') is None:
@@ -275,12 +505,101 @@ class data():
         else:
             limit = int(arguments.get('limit'))
 
+        if lastN is not None:
+            # Reads the most recent data, which is put back in time order below
+            sort = [(self.helpers.confs["data"]["timeField"], -1)]
+            limit = min(limit, lastN) if limit else lastN
+
+        if arguments.get('aggrMethod') is not None:
+            # Downsamples the matching data into time buckets
+            try:
+                if arguments.get('cursor') is not None:
+                    raise ValueError("cursor cannot be combined with aggrMethod")
+                methods, period = self.aggregation.prepare(arguments.get('aggrMethod'),
+                    arguments.get('aggrPeriod'), attribs)
+            except ValueError as e:
+                self.helpers.logger.info(self.program + " 400: " + str(e))
+                return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                    {}, False, accepted)
+
+            try:
+                data = self.aggregation.aggregate(arguments.get('type'), query, attribs,
+                    methods, period, offset, limit)
+            except ValueError as e:
+                self.helpers.logger.info(self.program + " 400: " + str(e))
+                return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                    {}, False, accepted)
+            except Exception as e:
+                self.helpers.logger.info(str(e))
+                data = []
+
+            if not len(data):
+                self.helpers.logger.info(
+                    self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
+
+                return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
+                                    {}, False, accepted)
+
+            self.helpers.logger.info(
+                self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
+
+            return self.broker.respond(200, data, headers, False, accepted)
+
+        # Prepares keyset pagination, an empty cursor requests the first page
+        cursor = arguments.get('cursor')
+        extra = []
+        countQuery = query
+        if cursor is not None:
+            if offset or (self.buckets is not None and
+                    self.buckets.isBucketed(arguments.get('type'))):
+                self.helpers.logger.info(
+                    self.program + " 400: cursor cannot be combined with offset or bucketed types")
+                return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                    {}, False, accepted)
+
+            sort = self.broker.cursorSort(sort)
+
+            # The sort keys are needed to create the next token, so they
+            # are projected even when they were not requested
+            for key, direction in sort:
+                if '*' in attribs and fields.get(key.split(".")[0]) is False:
+                    del fields[key.split(".")[0]]
+                    extra.append(key.split(".")[0])
+                elif len(fields) and '*' not in attribs and key != "_id" and \
+                        not any(key == attr or key.startswith(attr + ".") for attr in attribs):
+                    fields.update({key: True})
+                    extra.append(key)
+
+            if cursor != "":
+                try:
+                    after = self.broker.cursorFilter(cursor, sort)
+                except ValueError as e:
+                    self.helpers.logger.info(self.program + " 400: " + str(e))
+                    return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                        {}, False, accepted)
+                query = dict(query)
+                query["$and"] = query.get("$and", []) + [after]
+
         if fields == {}:
             fields = None
 
+        if self.indexes is not None and not (self.buckets is not None and
+                self.buckets.isBucketed(arguments.get('type'))):
+            self.indexes.sample(arguments.get('type'), query, sort)
+
+        # Single attribute unique values are found by MongoDB
+        distinct = unique_opt and cursor is None and not len(sort) and \
+            len(attribs) == 1 and attribs[0] not in ["*", "_id"] and \
+            not (self.buckets is not None and self.buckets.isBucketed(arguments.get('type')))
+
         try:
             # Creates the full query
-            if len(sort) and offset:
+            if distinct:
+                data = self.uniqueAttribute(collection, query, attribs[0], offset, limit)
+            elif self.buckets is not None and self.buckets.isBucketed(arguments.get('type')):
+                data = self.buckets.find(arguments.get('type'), query,
+                    fields, sort, offset, limit)
+            elif len(sort) and offset:
                 data = collection.find(
                     query, fields).skip(offset).sort(sort).limit(limit)
             elif offset:
@@ -293,10 +612,40 @@ class data():
                 data= collection.find(query, fields).limit(limit)
 
             if count_opt:
-                # Sets count header
-                headers["Count"] = data.count()
+                # Sets count header, ignoring the position of the cursor
+                headers["Count"] = self.counts.count(arguments.get('type'), countQuery)
+
+            if (stream_opt or ndjson) and cursor is None and not unique_opt \
+                    and lastN is None:
+                # Streams the results as they are read from the cursor
+                documents = iter(data)
+                first = next(documents, None)
+                if first is None:
+                    self.helpers.logger.info(
+                        self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
+
+                    return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
+                                        {}, False, accepted)
+
+                self.helpers.logger.info(
+                    self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
 
-            data = list(data)
+                return self.broker.stream(200, self.broker.prepend(first, documents), headers, ndjson)
+
+            if lastN is not None:
+                data = list(data)[::-1]
+
+            if unique_opt and cursor is None and not distinct:
+                data = self.uniqueValues(data)
+            else:
+                data = list(data)
+
+            if cursor is not None and limit and len(data) == limit:
+                # Sets the continuation token header
+                headers["Next-Cursor"] = self.broker.encodeCursor(sort, data[-1])
+            for entity in data if len(extra) else []:
+                for key in extra:
+                    self.stripField(entity, key)
 
             if not len(data):
                 self.helpers.logger.info(
@@ -306,25 +655,22 @@ class data():
                                     {}, False, accepted)
             else:
 
-                # Converts data to unique values
-                if unique_opt:
-                    newData = []
-                    for i, entity in enumerate(data):
-                        dataHolder = []
-                        for attr in entity:
-                            if isinstance(entity[attr], str):
-                                dataHolder.append(entity[attr])
-                            if isinstance(entity[attr], dict):
-                                dataHolder.append(entity[attr]["value"])
-                            if isinstance(entity[attr], list):
-                                dataHolder.append(entity[attr])
-                        [newData.append(x) for x in dataHolder if x not in newData]
-                    data = newData
+                # Converts a page of data to unique values
+                if unique_opt and cursor is not None:
+                    data = self.uniqueValues(data)
 
                 self.helpers.logger.info(
                     self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
 
+                if ndjson:
+                    return self.broker.stream(200, data, headers, True)
+
                 return self.broker.respond(200, data, headers, False, accepted)
+        except ValueError as e:
+            self.helpers.logger.info(self.program + " 400: " + str(e))
+
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                {}, False, accepted)
         except Exception as e:
             self.helpers.logger.info(
                 self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
@@ -333,11 +679,225 @@ class data():
             return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
                                 {}, False, accepted)
 
-    def getData(self, typeof, _id, attrs, accepted=[]):
-        """ Gets a specific HIASHDI data entry. """
+    def stripField(self, entity, key):
+        """ Removes a field that was only projected for the sort, along with
+        the parents it leaves empty. """
+
+        parents = [entity]
+        for part in key.split(".")[:-1]:
+            if not isinstance(parents[-1].get(part), dict):
+                return
+            parents.append(parents[-1][part])
+
+        parents[-1].pop(key.split(".")[-1], None)
+
+        parts = key.split(".")
+        for i in range(len(parents) - 1, 0, -1):
+            if len(parents[i]):
+                break
+            parents[i - 1].pop(parts[i - 1], None)
+
+    def uniqueKey(self, value):
+        """ Hashable key of a value, equal for equal values. """
+
+        if isinstance(value, (list, dict)):
+            return (type(value).__name__, json.dumps(value, sort_keys=True,
+                default=self.broker.jsonDefault))
+
+        return value
+
+    def uniqueValue(self, value):
+        """ Gets the value the unique option lists for an attribute.
+
+        Strings and arrays are listed as they are, and NGSI attributes as
+        their value. Returns the data module itself for other values,
+        which are not listed.
+        """
+
+        if isinstance(value, (str, list)):
+            return value
+        if isinstance(value, dict) and "value" in value:
+            return value["value"]
+
+        return self
+
+    def uniqueValues(self, documents):
+        """ Lists the unique attribute values of documents, in the order
+        they are first found.
+
+        Values are deduplicated with a set of their keys, so the documents
+        are read once and only the unique values are kept.
+        """
+
+        seen = set()
+        values = []
+
+        for document in documents:
+            for attr in document:
+                value = self.uniqueValue(document[attr])
+                if value is self:
+                    continue
+                key = self.uniqueKey(value)
+                if key not in seen:
+                    seen.add(key)
+                    values.append(value)
+
+        return values
+
+    def uniqueAttribute(self, collection, query, attr, offset=0, limit=0):
+        """ Lists the unique values of a single attribute with MongoDB.
+
+        The values are grouped by MongoDB, and are returned in the order
+        they are first found in the matching documents.
+        """
+
+        pipeline = [{"$match": query}]
+        if offset:
+            pipeline.append({"$skip": offset})
+        if limit:
+            pipeline.append({"$limit": limit})
+
+        pipeline += [
+            {"$match": {"$or": [{attr: {"$type": "string"}}, {attr: {"$type": "array"}},
+                {attr: {"$type": "object"}}]}},
+            {"$group": {
+                "_id": "$" + attr,
+                "first": {"$min": "$_id"}
+            }},
+            {"$sort": {"first": 1}}
+        ]
+
+        # NGSI attributes with equal values but different metadata are
+        # grouped separately, and are deduplicated here
+        return self.uniqueValues({attr: group["_id"]} for group in
+            collection.aggregate(pipeline, allowDiskUse=True))
+
+    def getStats(self, arguments, accepted=[]):
+        """ Gets summary statistics of data attributes.
+
+        Accepts the filters of the data listing, plus the numeric attrs to
+        summarize and optional percentiles, bins and window parameters.
+        """
+
+        try:
+            query = self.prepareQuery(arguments)
+            attrs, percentiles, bins, window = self.analytics.prepare(arguments)
+        except ValueError as e:
+            self.helpers.logger.info(
+                self.program + " 400: " + str(e))
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                {}, False, accepted)
+
+        fields = {self.helpers.confs["data"]["timeField"]: True}
+        for attr in attrs:
+            fields.update({attr: True})
+
+        if self.buckets is not None and self.buckets.isBucketed(arguments.get('type')):
+            try:
+                documents = self.buckets.find(arguments.get('type'), query, fields)
+            except ValueError as e:
+                self.helpers.logger.info(self.program + " 400: " + str(e))
+                return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                    {}, False, accepted)
+        else:
+            documents = self.getCollection(arguments.get('type')).find(
+                query, fields).batch_size(self.helpers.confs["stats"]["batchSize"])
+
+        summary = self.analytics.summarize(documents, attrs, percentiles, bins, window)
+
+        if not summary["Count"]:
+            self.helpers.logger.info(
+                self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
+
+            return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
+                                {}, False, accepted)
+
+        self.helpers.logger.info(
+            self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
+
+        return self.broker.respond(200, summary, {}, False, accepted)
+
+    def getExport(self, arguments, accepted=[]):
+        """ Exports data as an Arrow IPC stream, a Parquet file or CSV.
+
+        Accepts the filters, attrs, orderBy and limit of the data listing,
+        plus the format parameter.
+        """
+
+        typeof = arguments.get('type')
+
+        try:
+            query = self.prepareQuery(arguments)
+            mimetype, extension = self.export.prepare(arguments.get('format', "arrow"))
+            limit = int(arguments.get('limit', 0))
+        except ValueError as e:
+            self.helpers.logger.info(
+                self.program + " 400: " + str(e))
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                {}, False, accepted)
+
+        fields = None
+        if arguments.get('attrs') is not None and '*' not in arguments.get('attrs').split(","):
+            fields = {attr: True for attr in arguments.get('attrs').split(",")}
+
+        sort = self.prepareSort(arguments)
+
+        if self.buckets is not None and self.buckets.isBucketed(typeof):
+            try:
+                documents = iter(self.buckets.find(typeof, query, fields, sort, 0, limit))
+            except ValueError as e:
+                self.helpers.logger.info(self.program + " 400: " + str(e))
+                return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+                                    {}, False, accepted)
+        elif len(sort):
+            documents = self.getCollection(typeof).find(query, fields).sort(sort).limit(
+                limit).batch_size(self.helpers.confs["export"]["batchSize"])
+        else:
+            documents = self.getCollection(typeof).find(query, fields).limit(
+                limit).batch_size(self.helpers.confs["export"]["batchSize"])
+
+        first = next(documents, None)
+        if first is None:
+            self.helpers.logger.info(
+                self.program + " 404: " + self.helpers.confs["errorMessages"][str(404)]["Description"])
+
+            return self.broker.respond(404, self.helpers.confs["errorMessages"][str(404)],
+                                {}, False, accepted)
+
+        # Bucketed readings are not documents of their collection, so their
+        # columns come from the first batch only
+        sample = []
+        if not (self.buckets is not None and self.buckets.isBucketed(typeof)):
+            sample = self.export.sample(self.getCollection(typeof), fields)
+
+        self.helpers.logger.info(
+            self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
+
+        return self.broker.streamBytes(200,
+            self.export.generate(self.broker.prepend(first, documents), arguments.get('format', "arrow"),
+                sample),
+            {"Content-Disposition": "attachment; filename=" + typeof + "." + extension}, mimetype)
+
+    def getData(self, typeof, _id, attrs, accepted=[], ifNoneMatch=None):
+        """ Gets a specific HIASHDI data entry.
+
+        Responses carry an ETag, and 304 Not Modified is returned when it
+        matches the If-None-Match header.
+        """
 
         collection = self.getCollection(typeof)
 
+        key = json.dumps([collection.name, _id, attrs, sorted(accepted), self.broker.pretty()])
+        cached = self.entities.get(key)
+        if cached is not None:
+            status, headers, body = cached
+            if self.entities.matches(headers["ETag"], ifNoneMatch):
+                return self.broker.notModified({"ETag": headers["ETag"]})
+            return self.broker.respondBytes(status, body, dict(headers))
+
+        # Read before the query runs, so a modification during it is seen
+        modification = self.entities.modification(collection.name)
+
         query = {"_id": ObjectId(_id)}
 
         # Removes the MongoDB ID
@@ -361,6 +921,8 @@ class data():
                 clear_builtin = True
                 for attr in attribs:
                     fields.update({attr: True})
+                # The cached response is removed by the id of the entry
+                fields.update({"id": True})
         else:
             fields.update({'dateCreated': False})
             fields.update({'dateModified': False})
@@ -369,7 +931,10 @@ class data():
         if fields == {}:
             fields = None
 
-        data = list(collection.find(query, fields))
+        if self.buckets is not None and self.buckets.isBucketed(typeof):
+            data = list(self.buckets.find(typeof, query, fields))
+        else:
+            data = list(collection.find(query, fields))
 
         if not data:
             self.helpers.logger.info(
@@ -395,24 +960,226 @@ class data():
                 if "dateExpired" in data and 'dateExpired' not in attribs:
                     del data["dateExpired"]
 
+            entryId = data.get("id")
+            if clear_builtin and "id" not in attribs:
+                data.pop("id", None)
+
+            response = self.broker.respond(200, data, {}, False, accepted)
+            body = response.get_data()
+            response.headers["ETag"] = self.entities.etag(body)
+
+            self.entities.put(key, collection.name, entryId, modification,
+                200, dict(response.headers), body)
+
+            if self.entities.matches(response.headers["ETag"], ifNoneMatch):
+                self.helpers.logger.info(self.program + " 304: Not Modified")
+                return self.broker.notModified({"ETag": response.headers["ETag"]})
+
             self.helpers.logger.info(
                 self.program + " 200: " + self.helpers.confs["successMessage"][str(200)]["Description"])
 
-            return self.broker.respond(200, data, {}, False, accepted)
+            return response
 
-    def createData(self, data, typeof, accepted=[]):
+    def createData(self, data, typeof, accepted=[], key=None):
         """ Creates a new HIASHDI data entry."""
 
-        collection = self.getCollection(typeof)
+        if key is not None and self.dedupe is not None:
+            data[self.dedupe.field] = key
 
-        _id = collection.insert(data)
+        try:
+            if self.groupCommit is not None:
+                _id = self.groupCommit.submit(typeof, data)
+            else:
+                ids, errors = self.insertDatas(typeof, [data])
+                if len(errors):
+                    raise ValueError(errors[0])
+                _id = ids[0]
+        except Exception as e:
+            self.helpers.logger.info("Mongo data inserted FAILED!")
+            self.helpers.logger.info(str(e))
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
+                                {}, False, accepted)
 
-        if str(_id) is not False:
-            return self.broker.respond(201, {}, {"Id": str(_id)}, False, accepted)
-        else:
+        if _id is None:
+            return self.broker.respond(200, {}, {"Duplicate": "true"}, False, accepted)
+
+        return self.broker.respond(201, {}, {"Id": str(_id)}, False, accepted)
+
+    def insertDatas(self, typeof, datas, writeConcern=None):
+        """ Inserts a batch of HIASHDI data entries in one round trip.
+
+        The batch is written unordered so a single bad document does not
+        stop the rest of the batch. Returns the list of inserted ids, with
+        None for failed or duplicate documents, and a dict of errors keyed
+        by index.
+
+        If the spill log is enabled the batch is written to it instead
+        while MongoDB is unreachable or slow.
+        """
+
+        ids = [None] * len(datas)
+        errors = {}
+
+        positions = list(range(len(datas)))
+        if self.dedupe is not None:
+            positions = self.dedupe.filter(typeof, datas)
+
+        batch = [datas[i] for i in positions]
+        if not len(batch):
+            return ids, errors
+
+        if self.spill is not None and self.spill.spilling():
+            return self.spillDatas(typeof, batch, positions, ids), errors
+
+        skipped = set()
+
+        try:
+            start = time.monotonic()
+            for error in self.writeDatas(typeof, batch, writeConcern):
+                entry = batch[error["index"]]
+                if self.dedupe is not None and \
+                        self.dedupe.isDuplicate(typeof, entry, error):
+                    skipped.add(error["index"])
+                    continue
+                if self.dedupe is not None:
+                    self.dedupe.forget(typeof, entry)
+                errors[positions[error["index"]]] = error["errmsg"]
+        except ConnectionFailure as e:
+            if self.spill is None:
+                self.forgetDatas(typeof, batch)
+                raise
+            self.helpers.logger.error(self.program + " MongoDB write failed: " + str(e))
+            self.mongodb.healthy = False
+            return self.spillDatas(typeof, batch, positions, ids), errors
+        except Exception:
+            self.forgetDatas(typeof, batch)
+            raise
+
+        if self.spill is not None:
+            self.spill.recordLatency(time.monotonic() - start)
+
+        for i, entity in enumerate(batch):
+            if i not in skipped and positions[i] not in errors and "_id" in entity:
+                ids[positions[i]] = entity["_id"]
+
+        return ids, errors
+
+    def forgetDatas(self, typeof, batch):
+        """ Forgets the idempotency keys of a batch that was not stored, so
+        a retry is not dropped as a duplicate. """
+
+        if self.dedupe is not None:
+            for entry in batch:
+                self.dedupe.forget(typeof, entry)
+
+    def writeDatas(self, typeof, batch, writeConcern=None):
+        """ Writes a batch of HIASHDI data entries to its collection.
+
+        Returns the write errors of the entries that were not stored.
+        """
+
+        # Changed before and after, so results read during the write are
+        # not cached as current
+        self.changed(self.getCollection(typeof).name)
+
+        errors = []
+        rejected = []
+        positions = list(range(len(batch)))
+
+        if self.buckets is not None and self.buckets.applies(typeof):
+            # Entries with a time that cannot be read are not stored
+            positions = []
+            for i, entry in enumerate(batch):
+                try:
+                    self.buckets.timestamp(entry)
+                    positions.append(i)
+                except ValueError as e:
+                    rejected.append({"index": i, "code": 2, "errmsg": str(e)})
+
+        entries = [batch[i] for i in positions]
+
+        try:
+            if not len(entries):
+                pass
+            elif self.buckets is not None and self.buckets.isBucketed(typeof):
+                errors = self.buckets.insert(typeof, entries)
+            else:
+                collection = self.getCollection(typeof)
+                if writeConcern is not None:
+                    collection = collection.with_options(write_concern=writeConcern)
+
+                collection.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+        finally:
+            self.changed(self.getCollection(typeof).name)
+
+        errors = [dict(error, index=positions[error["index"]]) for error in errors] + rejected
+
+        if self.latest is not None:
+            self.latest.update(typeof, batch, errors)
+
+        return errors
+
+    def spillDatas(self, typeof, batch, positions, ids):
+        """ Writes a batch of HIASHDI data entries to the spill log. """
+
+        spilled, errors = self.spill.write(typeof, batch)
+        for i, position in enumerate(positions):
+            ids[position] = spilled[i]
+
+        return ids
+
+    def createDatas(self, datas, typeof, accepted=[]):
+        """ Creates a batch of new HIASHDI data entries. """
+
+        results = []
+        inserts = []
+        positions = []
+
+        for i, entity in enumerate(datas):
+            if isinstance(entity, dict):
+                inserts.append(entity)
+                positions.append(i)
+                results.append(None)
+            else:
+                results.append({
+                    "Error": self.helpers.confs["errorMessages"]["400b"]["Error"],
+                    "Description": "Item " + str(i) + " is not a JSON object"
+                })
+
+        try:
+            ids, errors = self.insertDatas(typeof, inserts)
+        except Exception as e:
+            self.helpers.logger.info("Mongo batch data inserted FAILED!")
+            self.helpers.logger.info(str(e))
             return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
                                 {}, False, accepted)
 
+        created = 0
+        for i, position in enumerate(positions):
+            if i in errors:
+                results[position] = {
+                    "Error": self.helpers.confs["errorMessages"]["400p"]["Error"],
+                    "Description": errors[i]
+                }
+            elif ids[i] is None:
+                results[position] = {"Duplicate": True}
+                created += 1
+            else:
+                results[position] = {"Id": str(ids[i])}
+                created += 1
+
+        self.helpers.logger.info(self.program + " batch created " + \
+            str(created) + " of " + str(len(datas)) + " " + typeof + " entries")
+
+        if created == len(datas):
+            return self.broker.respond(201, results, {}, False, accepted)
+        elif created:
+            return self.broker.respond(207, results, {}, False, accepted)
+        else:
+            return self.broker.respond(400, results, {}, False, accepted)
+
     def updateEntityPost(self, _id, typeof, data, options, accepted=[]):
         """ Updates an HIASHDI Entity.
 
@@ -426,8 +1193,13 @@ class data():
                         - Update or Append Entity Attributes
         """
 
+        if typeof in self.mongodb.collextions:
+            collection = self.mongodb.collextions[typeof]
+        else:
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
+                                {}, False, accepted)
+
         updated = False
-        error = False
         _append = False
         _keyValues = False
 
@@ -443,22 +1215,20 @@ class data():
                 _append = True if option == "append" else _append
                 _keyValues = True if option == "keyValues" else _keyValues
 
-        if _append:
-            entity = list(collection.find({'id': _id}))
-            for update in data:
-                if update in entity[0]:
-                    error = True
-                else:
-                    collection.update_one({"id" : _id},
-                        {"$set": {update: data[update]}}, upsert=True)
-                    updated = True
-        else:
-            for update in data:
-                collection.update_one({"id" : _id},
-                            {"$set": {update: data[update]}}, upsert=True)
+        if len(data):
+            if _append:
+                # Only matches if none of the attributes exist yet
+                query = {"id": _id}
+                for update in data:
+                    query.update({update: {"$exists": False}})
+                result = collection.update_one(query, {"$set": data})
+                updated = result.matched_count == 1
+            else:
+                collection.update_one({"id" : _id}, {"$set": data}, upsert=True)
                 updated = True
 
-        if updated and error is False:
+        if updated:
+            self.changed(collection.name, _id)
             return self.broker.respond(204, self.helpers.confs["successMessage"][str(204)],
                                 {}, False, accepted)
         else:
@@ -478,8 +1248,13 @@ class data():
                         - Update Existing Entity Attributes
         """
 
+        if typeof in self.mongodb.collextions:
+            collection = self.mongodb.collextions[typeof]
+        else:
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
+                                {}, False, accepted)
+
         updated = False
-        error = False
 
         if "id" in data:
             del data['id']
@@ -492,18 +1267,18 @@ class data():
         if options is not None:
             options = options.split(",")
             for option in options:
-                _keyValues = True if option == "keyValues" else keyValues
+                _keyValues = True if option == "keyValues" else _keyValues
 
-        entity = list(collection.find({'id': _id}))
-        for update in data:
-            if update not in entity[0]:
-                error = True
-            else:
-                collection.update_one({"id" : _id},
-                    {"$set": {update: data[update]}})
-                updated = True
+        if len(data):
+            # Only matches if all of the attributes already exist
+            query = {"id": _id}
+            for update in data:
+                query.update({update: {"$exists": True}})
+            result = collection.update_one(query, {"$set": data})
+            updated = result.matched_count == 1
 
-        if updated and error is False:
+        if updated:
+            self.changed(collection.name, _id)
             return self.broker.respond(204, self.helpers.confs["successMessage"][str(204)],
                                 {}, False, accepted)
         else:
@@ -523,19 +1298,26 @@ class data():
                         - Replace all entity attributes
         """
 
+        if typeof in self.mongodb.collextions:
+            collection = self.mongodb.collextions[typeof]
+        else:
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
+                                {}, False, accepted)
+
         if "id" in data:
             del data['id']
 
         if "type" in data:
             del data['type']
 
+        # Builtin fields kept when the attributes are replaced
         fields = {
-            '_id': False,
-            'id': False,
-            'type': False,
-            'dateCreated': False,
-            'dateModified': False,
-            'dateExpired': False
+            '_id': "$_id",
+            'id': "$id",
+            'type': "$type",
+            'dateCreated': "$dateCreated",
+            'dateModified': "$dateModified",
+            'dateExpired': "$dateExpired"
         }
 
         updated = False
@@ -546,17 +1328,14 @@ class data():
             for option in options:
                 _keyValues = True if option == "keyValues" else _keyValues
 
-        entity = list(collection.find({"id": _id}, fields))
-
-        for e in entity:
-            collection.update({"id": _id}, {'$unset': {e: ""}})
-
-        for update in data:
-            collection.update_one({"id" : _id},
-                {"$set": {update: data[update]}}, upsert=True)
+        if len(data):
+            collection.update_one({"id": _id}, [
+                {"$replaceRoot": {"newRoot": {"$mergeObjects": [fields, {"$literal": data}]}}}
+            ], upsert=True)
             updated = True
 
         if updated:
+            self.changed(collection.name, _id)
             return self.broker.respond(204, self.helpers.confs["successMessage"][str(204)],
                                 {}, False, accepted)
         else:
@@ -586,6 +1365,7 @@ class data():
         result = collection.delete_one({"id": _id})
 
         if result.deleted_count == 1:
+            self.changed(collection.name, _id)
             self.helpers.logger.info("Mongo data delete OK")
             return self.broker.respond(204, {}, {}, False, accepted)
         else:
@@ -674,6 +1454,12 @@ class data():
                         - Update Attribute Data
         """
 
+        if typeof in self.mongodb.collextions:
+            collection = self.mongodb.collextions[typeof]
+        else:
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
+                                {}, False, accepted)
+
         query = {"id": _id}
 
         if typeof is not None:
@@ -729,6 +1515,7 @@ class data():
 
             collection.update_one({"id": _id},
                 {"$set": {path: data}}, upsert=True)
+            self.changed(collection.name, _id)
             return self.broker.respond(204, self.helpers.confs["successMessage"][str(204)],
                                 {}, False, accepted)
 
@@ -745,6 +1532,12 @@ class data():
                         - Update Attribute Data
         """
 
+        if typeof in self.mongodb.collextions:
+            collection = self.mongodb.collextions[typeof]
+        else:
+            return self.broker.respond(400, self.helpers.confs["errorMessages"]["400b"],
+                                {}, False, accepted)
+
         query = {"id": _id}
 
         if typeof is not None:
@@ -770,5 +1563,6 @@ class data():
         else:
             collection.update({"id": _id},
                         {'$unset': {_attr: ""}})
+            self.changed(collection.name, _id)
             return self.broker.respond(204, self.helpers.confs["successMessage"][str(204)],
                                 {}, False, accepted)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" HIASHDI Duplicate Suppression Module.
+
+This module drops duplicate data entries, such as MQTT QoS 1 redeliveries
+and client retries, using idempotency keys.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class dedupe():
+	""" HIASHDI Duplicate Suppression Module.
+
+	This module drops duplicate data entries, such as MQTT QoS 1 redeliveries
+	and client retries, using idempotency keys.
+
+	The key is supplied by the client, or is a hash of the entry. The hash
+	covers the entity and timestamp of the entry when it has them. Entries
+	without a timestamp of their own are hashed with the window period they
+	arrived in, so a later reading with the same value is still stored.
+	Keys seen within the last window seconds are held in memory so most
+	duplicates are dropped without a database read. Older duplicates are
+	caught by a unique index on the key field.
+
+	Bucketed types cannot have that index, as their readings are not
+	documents of their own, so for them only duplicates within the window
+	are dropped.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Duplicate Suppression Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["idempotency"]
+		self.field = self.confs["field"]
+		self.timeField = self.helpers.confs["data"]["timeField"]
+
+		self.keys = OrderedDict()
+		self.lock = threading.Lock()
+		self.duplicates = 0
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Creates the unique key indexes. """
+
+		for typeof in self.confs["types"]:
+			if self.data.buckets is not None and self.data.buckets.isBucketed(typeof):
+				self.helpers.logger.warning(self.program + " " + typeof + \
+					" is bucketed, so duplicates older than the window are stored")
+				continue
+			try:
+				self.data.getCollection(typeof).create_index(
+					self.field, unique=True, sparse=True, background=True)
+			except Exception as e:
+				self.helpers.logger.error(self.program + " " + typeof + \
+					" index not created: " + str(e))
+
+		self.helpers.logger.info(self.program + " started.")
+
+	def applies(self, typeof):
+		""" Whether duplicates are suppressed for a data type. """
+
+		return typeof in self.confs["types"]
+
+	def digest(self, payload, entry=None):
+		""" Hashes a payload into an idempotency key.
+
+		entry is the decoded payload, when payload is its raw form. If it
+		has no timestamp the current window period is hashed as well.
+		"""
+
+		if entry is None:
+			entry = payload
+		if not isinstance(payload, bytes):
+			payload = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+
+		if not isinstance(entry, dict) or self.timeField not in entry:
+			payload += b"\n" + str(int(time.time() // self.confs["window"])).encode("utf-8")
+
+		return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+	def filter(self, typeof, datas):
+		""" Sets the idempotency key of each entry and returns the indexes of
+		the entries not seen within the window. """
+
+		if not self.applies(typeof):
+			return list(range(len(datas)))
+
+		positions = []
+		now = time.monotonic()
+
+		with self.lock:
+			while len(self.keys):
+				key, expires = next(iter(self.keys.items()))
+				if expires > now:
+					break
+				self.keys.popitem(last=False)
+
+			for i, entry in enumerate(datas):
+				if self.field not in entry:
+					entry[self.field] = self.digest(entry)
+				key = (typeof, entry[self.field])
+				if key in self.keys:
+					self.duplicates += 1
+					continue
+				self.keys[key] = now + self.confs["window"]
+				if len(self.keys) > self.confs["maxKeys"]:
+					self.keys.popitem(last=False)
+				positions.append(i)
+
+		return positions
+
+	def isDuplicate(self, typeof, entry, error):
+		""" Whether a write error is a duplicate idempotency key. """
+
+		if error["code"] == 11000 and self.applies(typeof) and self.field in entry and \
+				(self.field in error.get("keyPattern", {}) or self.field in error["errmsg"]):
+			with self.lock:
+				self.duplicates += 1
+			return True
+		return False
+
+	def forget(self, typeof, entry):
+		""" Removes the key of an entry that could not be stored, so a retry
+		is not dropped. """
+
+		with self.lock:
+			self.keys.pop((typeof, entry.get(self.field)), None)
+
+	def stats(self):
+		""" Returns the duplicate suppression counters. """
+
+		with self.lock:
+			return {
+				"Keys": len(self.keys),
+				"Duplicates": self.duplicates
+			}
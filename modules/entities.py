@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+""" HIASHDI Entities Module.
+
+This module caches the responses of single data entries, and provides
+their ETags so clients can revalidate them with If-None-Match.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class entities():
+	""" HIASHDI Entities Module.
+
+	This module caches the responses of single data entries, and provides
+	their ETags so clients can revalidate them with If-None-Match.
+
+	ETags are hashes of the serialized response, so they change exactly
+	when the representation does.
+
+	Cached responses are keyed by collection, _id, attrs and the response
+	format, and indexed by the NGSI id of the entry. They are removed when
+	that entry is updated or deleted, expire after entities.ttl seconds,
+	and the least recently used are evicted beyond entities.maxEntries.
+	Responses read while any entry of their collection was being modified
+	are not cached.
+	"""
+
+	def __init__(self, helpers):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Entities Module"
+
+		self.confs = self.helpers.confs["entities"]
+
+		self.cache = OrderedDict()
+		self.ids = {}
+		self.modifications = {}
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def etag(self, body):
+		""" Creates the strong ETag of a response body. """
+
+		return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+	def matches(self, etag, ifNoneMatch):
+		""" Whether an If-None-Match header matches an ETag.
+
+		Weak comparison is used, as RFC 7232 requires for If-None-Match.
+		"""
+
+		if ifNoneMatch is None:
+			return False
+
+		for candidate in ifNoneMatch.split(","):
+			candidate = candidate.strip()
+			if candidate == "*" or candidate.replace("W/", "", 1) == etag:
+				return True
+
+		return False
+
+	def modification(self, name):
+		""" Gets the modification counter of a collection. """
+
+		return self.modifications.get(name, 0)
+
+	def get(self, key):
+		""" Gets a cached response as (status, headers, body), or None. """
+
+		if not self.confs["enabled"]:
+			return None
+
+		with self.lock:
+			entry = self.cache.get(key)
+			if entry is None or entry["expires"] < time.time():
+				if entry is not None:
+					self.evict(key)
+				self.misses += 1
+				return None
+
+			self.cache.move_to_end(key)
+			self.hits += 1
+
+			return entry["status"], entry["headers"], entry["body"]
+
+	def put(self, key, name, _id, modification, status, headers, body):
+		""" Caches a response read at a modification counter. """
+
+		if not self.confs["enabled"]:
+			return
+
+		with self.lock:
+			if self.modifications.get(name, 0) != modification:
+				return
+
+			if key in self.cache:
+				self.evict(key)
+
+			self.cache[key] = {
+				"id": (name, _id),
+				"expires": time.time() + self.confs["ttl"],
+				"status": status,
+				"headers": headers,
+				"body": body
+			}
+			self.ids.setdefault((name, _id), set()).add(key)
+
+			while len(self.cache) > self.confs["maxEntries"]:
+				self.evict(next(iter(self.cache)))
+
+	def modified(self, name, _id):
+		""" Removes the cached responses of an entry that is modified. """
+
+		with self.lock:
+			self.modifications[name] = self.modifications.get(name, 0) + 1
+			for key in list(self.ids.get((name, _id), [])):
+				self.evict(key)
+
+	def evict(self, key):
+		""" Removes an entry, the caller holds the lock. """
+
+		entry = self.cache.pop(key)
+		keys = self.ids.get(entry["id"])
+		if keys is not None:
+			keys.discard(key)
+			if not len(keys):
+				del self.ids[entry["id"]]
+
+	def stats(self):
+		""" Returns the entity cache counters. """
+
+		with self.lock:
+			return {
+				"Size": len(self.cache),
+				"Hits": self.hits,
+				"Misses": self.misses
+			}
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+""" HIASHDI Export Module.
+
+This module exports historical data in columnar formats, Apache Arrow
+IPC streams, Parquet files and CSV, written batch by batch as the
+cursor is read.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.parquet as pq
+
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+
+
+class sink():
+	""" Write only file object collecting the bytes written by Arrow. """
+
+	def __init__(self):
+		""" Initializes the class. """
+
+		self.chunks = []
+		self.closed = False
+		self.position = 0
+
+	def write(self, data):
+		""" Collects written bytes. """
+
+		self.chunks.append(bytes(data))
+		self.position += len(data)
+		return len(data)
+
+	def tell(self):
+		""" Returns the number of bytes written. """
+
+		return self.position
+
+	def flush(self):
+		""" Nothing to flush, the bytes are taken by read. """
+
+		pass
+
+	def close(self):
+		""" Marks the sink closed. """
+
+		self.closed = True
+
+	def read(self):
+		""" Takes the bytes collected since the last call. """
+
+		data = b"".join(self.chunks)
+		self.chunks = []
+		return data
+
+
+class export():
+	""" HIASHDI Export Module.
+
+	This module exports historical data in columnar formats, Apache Arrow
+	IPC streams, Parquet files and CSV, written batch by batch as the
+	cursor is read.
+
+	The columns of an export are inferred for its data type, from the
+	first batch and from a random sample of the documents of the type, so
+	attributes missing from the first batch are exported too. Numbers are
+	always exported as floats and mixed types as strings, widened with
+	promote across the batch and the sample. The schema of a stream cannot
+	change once written, so later batches are converted to it, and values
+	that cannot be converted are exported as nulls.
+
+	Documents are flattened into columns first. ObjectIds become strings,
+	NGSI attributes become their value, and other objects and arrays
+	become JSON strings.
+	"""
+
+	formats = {
+		"arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+		"parquet": ("application/vnd.apache.parquet", "parquet"),
+		"csv": ("text/csv", "csv")
+	}
+
+	def __init__(self, helpers, broker):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Export Module"
+
+		self.broker = broker
+
+		self.confs = self.helpers.confs["export"]
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def prepare(self, format):
+		""" Gets the mimetype and file extension of a format.
+
+		Raises ValueError if the format is not supported.
+		"""
+
+		if format not in self.formats:
+			raise ValueError("Unsupported export format " + str(format))
+
+		return self.formats[format]
+
+	def flatten(self, document):
+		""" Converts a document into a row of plain column values. """
+
+		row = {}
+		for key, value in document.items():
+			if isinstance(value, dict) and "value" in value:
+				value = value["value"]
+			if isinstance(value, ObjectId):
+				value = str(value)
+			elif isinstance(value, (dict, list)):
+				value = self.broker.encode(value)
+			elif value is not None and not isinstance(value,
+					(bool, int, float, str, datetime)):
+				value = str(value)
+			row[key] = value
+
+		return row
+
+	def batches(self, documents):
+		""" Groups documents into batches of flattened rows. """
+
+		rows = []
+		for document in documents:
+			rows.append(self.flatten(document))
+			if len(rows) >= self.confs["batchSize"]:
+				yield rows
+				rows = []
+
+		if len(rows):
+			yield rows
+
+	def promote(self, rows):
+		""" Makes the values of each column of a batch share one type.
+
+		Integers are promoted to floats in columns holding both, and values
+		of columns holding other mixed types are converted to strings.
+		"""
+
+		kinds = {}
+		for row in rows:
+			for key, value in row.items():
+				if value is not None:
+					kinds.setdefault(key, set()).add(type(value).__name__)
+
+		for key, found in kinds.items():
+			if found == {"int", "float"}:
+				for row in rows:
+					if isinstance(row.get(key), int):
+						row[key] = float(row[key])
+			elif len(found) > 1:
+				for row in rows:
+					if row.get(key) is not None:
+						row[key] = str(row[key])
+
+		return rows
+
+	def sample(self, collection, fields=None):
+		""" Reads a random sample of the documents of a type as rows. """
+
+		pipeline = [{"$sample": {"size": self.confs["sampleSize"]}}]
+		if fields is not None:
+			pipeline.append({"$project": fields})
+
+		try:
+			return [self.flatten(document) for document in collection.aggregate(pipeline)]
+		except PyMongoError as e:
+			self.helpers.logger.error(self.program + " sample failed, " + \
+				"using the first batch only: " + str(e))
+			return []
+
+	def type(self, kinds):
+		""" Gets the column type of a set of value kinds. """
+
+		if len(kinds) and kinds <= {"int", "float"}:
+			# Readings that are whole numbers in some documents may not be
+			# in others, so integers are exported as floats
+			return pa.float64()
+		elif kinds == {"bool"}:
+			return pa.bool_()
+		elif kinds == {"datetime"}:
+			return pa.timestamp("us")
+
+		# Mixed kinds and columns only holding nulls are exported as strings
+		return pa.string()
+
+	def infer(self, rows, sample=[]):
+		""" Infers the export schema from the first batch of rows and a
+		sample of the documents of the type. """
+
+		found = {}
+		for row in self.promote(rows) + self.promote(sample):
+			for key, value in row.items():
+				kinds = found.setdefault(key, set())
+				if value is not None:
+					kinds.add(type(value).__name__)
+
+		return pa.schema([pa.field(key, self.type(kinds)) for key, kinds in found.items()])
+
+	def convert(self, value, type):
+		""" Converts a value to a column type, or None if it cannot be. """
+
+		if value is None:
+			return None
+		if pa.types.is_string(type):
+			return value if isinstance(value, str) else str(value)
+		if pa.types.is_boolean(type):
+			return value if isinstance(value, bool) else None
+		if isinstance(value, bool):
+			return None
+		if pa.types.is_floating(type):
+			return float(value) if isinstance(value, (int, float)) else None
+		if pa.types.is_integer(type):
+			return int(value) if isinstance(value, (int, float)) and value == int(value) else None
+		if pa.types.is_timestamp(type):
+			return value if isinstance(value, datetime) else None
+		return None
+
+	def batch(self, rows, schema):
+		""" Converts rows to a record batch with the export schema. """
+
+		try:
+			return pa.RecordBatch.from_pylist(rows, schema=schema)
+		except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+			return pa.RecordBatch.from_pylist([{field.name: self.convert(row.get(field.name),
+				field.type) for field in schema} for row in rows], schema=schema)
+
+	def writer(self, format, out, schema):
+		""" Opens a writer of a format on a sink. """
+
+		if format == "arrow":
+			return pa.ipc.new_stream(out, schema)
+		elif format == "parquet":
+			return pq.ParquetWriter(out, schema, compression=self.confs["compression"])
+
+		return csv.CSVWriter(out, schema)
+
+	def generate(self, documents, format, sample=[]):
+		""" Writes documents in a format, yielding the bytes of each batch. """
+
+		out = sink()
+		writer = None
+
+		try:
+			for rows in self.batches(documents):
+				if writer is None:
+					schema = self.infer(rows, sample)
+					writer = self.writer(format, out, schema)
+
+				batch = self.batch(rows, schema)
+				if format == "parquet":
+					writer.write_table(pa.Table.from_batches([batch]))
+				else:
+					writer.write_batch(batch)
+
+				yield out.read()
+
+			if writer is None:
+				writer = self.writer(format, out, pa.schema([]))
+			writer.close()
+
+			yield out.read()
+		finally:
+			if hasattr(documents, "close"):
+				documents.close()
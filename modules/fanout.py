@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+""" HIASHDI Fan-out Module.
+
+This module runs a data listing over several data types in parallel, and
+merges the results in time order.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+
+import heapq
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class fanout():
+	""" HIASHDI Fan-out Module.
+
+	This module runs a data listing over several data types in parallel, and
+	merges the results in time order.
+
+	The query of each type runs on a shared thread pool, which also reads
+	the first batch of every cursor, so the slowest type sets the latency
+	rather than the sum of all of them. The sorted cursors are then merged
+	lazily with a k-way heap merge on the time field, so documents can be
+	streamed as they are merged.
+
+	A global limit is applied early: no type can contribute more than
+	offset + limit documents, so every cursor is limited to that.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Fan-out Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["fanout"]
+		self.timeField = self.helpers.confs["data"]["timeField"]
+
+		self.executor = ThreadPoolExecutor(max_workers=self.confs["workers"],
+						thread_name_prefix="fanout")
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def prepare(self, arguments, types):
+		""" Validates a multi type listing and returns its time direction.
+
+		Raises ValueError if the listing cannot be merged.
+		"""
+
+		if len(types) > self.confs["maxTypes"]:
+			raise ValueError("At most " + str(self.confs["maxTypes"]) + " types can be merged")
+		if len(set(types)) != len(types):
+			raise ValueError("Types are repeated: " + ",".join(types))
+		for typeof in types:
+			if typeof not in self.confs["types"]:
+				raise ValueError(typeof + " does not support multi type listings")
+
+		for parameter in ["cursor", "aggrMethod"]:
+			if arguments.get(parameter) is not None:
+				raise ValueError(parameter + " cannot be combined with multiple types")
+		for option in ["latest", "unique"]:
+			if arguments.get('options') is not None and \
+					option in arguments.get('options').split(","):
+				raise ValueError(option + " cannot be combined with multiple types")
+
+		orderBy = arguments.get('orderBy')
+		if orderBy is None or orderBy == self.timeField:
+			return 1
+		elif orderBy == "!" + self.timeField:
+			return -1
+
+		raise ValueError("Multiple types can only be ordered by " + self.timeField)
+
+	def project(self, fields, attribs):
+		""" Adds the time field to a projection, as the merge needs it. """
+
+		if len(fields) and '*' not in attribs:
+			fields = dict(fields)
+			fields[self.timeField] = True
+
+		return fields if len(fields) else None
+
+	def open(self, typeof, query, fields, direction, limit):
+		""" Runs the query of one type and reads its first batch.
+
+		Returns the cursor with the generator of its tagged documents, as
+		closing a generator that has not started does not close its cursor.
+		"""
+
+		sort = [(self.timeField, direction)]
+
+		if self.data.buckets is not None and self.data.buckets.isBucketed(typeof):
+			documents = iter(self.data.buckets.find(typeof, query, fields, sort, 0, limit))
+		else:
+			if self.data.indexes is not None:
+				self.data.indexes.sample(typeof, query, sort)
+			documents = self.data.getCollection(typeof).find(
+				query, fields).sort(sort).limit(limit)
+			if limit:
+				documents = documents.batch_size(limit)
+
+		return documents, self.tag(typeof, documents, next(documents, None))
+
+	def tag(self, typeof, documents, first):
+		""" Yields the documents of a type, marked with the type. """
+
+		try:
+			document = first
+			while document is not None:
+				document[self.confs["typeField"]] = typeof
+				yield document
+				document = next(documents, None)
+		finally:
+			if hasattr(documents, "close"):
+				documents.close()
+
+	def key(self, document):
+		""" Gets the merge key of a document.
+
+		Times are ranked by type the way MongoDB sorts them, so missing
+		times come first, then numbers, strings, other values and dates,
+		and each type is only compared with itself.
+		"""
+
+		time = document.get(self.timeField)
+
+		if time is None:
+			return (0, 0)
+		if isinstance(time, bool):
+			return (4, time)
+		if isinstance(time, (int, float)):
+			return (1, time)
+		if isinstance(time, str):
+			return (2, time)
+		if isinstance(time, datetime):
+			return (5, time)
+		return (3, str(time))
+
+	def find(self, types, query, fields, direction, offset, limit):
+		""" Runs a query over several types and merges them by time. """
+
+		futures = [self.executor.submit(self.open, typeof, query, fields, direction,
+						offset + limit if limit else 0) for typeof in types]
+
+		sources = []
+		try:
+			for future in futures:
+				sources.append(future.result())
+		except Exception:
+			# Waits for the queries still running, so none is left open
+			for future in futures:
+				if future.exception() is None:
+					self.close(future.result())
+			raise
+
+		return self.merge(sources, direction, offset, limit)
+
+	def close(self, source):
+		""" Closes the generator of a source and its cursor. """
+
+		documents, tagged = source
+		tagged.close()
+		if hasattr(documents, "close"):
+			documents.close()
+
+	def merge(self, sources, direction, offset, limit):
+		""" Merges the sources by time, and closes them when the merge ends. """
+
+		try:
+			merged = heapq.merge(*[tagged for documents, tagged in sources],
+				key=self.key, reverse=direction == -1)
+			yield from itertools.islice(merged, offset, offset + limit if limit else None)
+		finally:
+			for source in sources:
+				self.close(source)
+
+	def count(self, types, query):
+		""" Counts the matching documents of several types in parallel. """
+
+		return sum(self.executor.map(lambda typeof: self.data.counts.count(typeof, query), types))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+""" HIASHDI Group Commit Module.
+
+This module gathers data entries created by concurrent requests and
+writes them to MongoDB as one insert_many per collection.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import threading
+import time
+
+from concurrent.futures import Future
+from pymongo.write_concern import WriteConcern
+
+
+class groupcommit():
+	""" HIASHDI Group Commit Module.
+
+	This module gathers data entries created by concurrent requests and
+	writes them to MongoDB as one insert_many per collection.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Group Commit Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["groupCommit"]
+		self.batchSize = self.confs["batchSize"]
+		self.maxWait = self.confs["maxWait"]
+		self.writeConcern = WriteConcern(**self.confs["writeConcern"])
+
+		self.pending = {}
+		self.size = 0
+		self.first = None
+		self.condition = threading.Condition()
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Starts the commit thread. """
+
+		threading.Thread(target=self.committer, args=(), daemon=True).start()
+
+		self.helpers.logger.info(self.program + " started.")
+
+	def submit(self, typeof, entry):
+		""" Queues an entry for the next group commit.
+
+		Blocks until the entry has been written and returns its _id, or
+		raises the error that stopped it being written.
+		"""
+
+		future = Future()
+
+		with self.condition:
+			self.pending.setdefault(typeof, []).append((entry, future))
+			self.size += 1
+			if self.first is None:
+				self.first = time.monotonic()
+			self.condition.notify()
+
+		return future.result()
+
+	def committer(self):
+		""" Writes the pending entries once the batch is full or the oldest
+		entry has waited maxWait seconds. """
+
+		while True:
+			with self.condition:
+				while self.first is None:
+					self.condition.wait()
+				while self.size < self.batchSize:
+					remaining = self.first + self.maxWait - time.monotonic()
+					if remaining <= 0:
+						break
+					self.condition.wait(remaining)
+
+				pending = self.pending
+				self.pending = {}
+				self.size = 0
+				self.first = None
+
+			for typeof in pending:
+				self.commit(typeof, pending[typeof])
+
+	def commit(self, typeof, batch):
+		""" Writes one collection's batch and resolves each caller's future. """
+
+		entries = [entry for entry, future in batch]
+
+		try:
+			ids, errors = self.data.insertDatas(typeof, entries, self.writeConcern)
+		except Exception as e:
+			self.helpers.logger.error(self.program + " " + typeof + \
+				" batch of " + str(len(batch)) + " not stored: " + str(e))
+			for entry, future in batch:
+				future.set_exception(e)
+			return
+
+		for i, (entry, future) in enumerate(batch):
+			if i in errors:
+				future.set_exception(ValueError(errors[i]))
+			else:
+				future.set_result(ids[i])
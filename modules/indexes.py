@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+""" HIASHDI Indexes Module.
+
+This module builds the declared indexes of the HIASHDI collections, and
+advises on the indexes missing for the queries the API receives.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import random
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+
+class indexes():
+	""" HIASHDI Indexes Module.
+
+	This module builds the declared indexes of the HIASHDI collections, and
+	advises on the indexes missing for the queries the API receives.
+
+	Declared indexes are listed per type in indexes.declared. Those under
+	"*" apply to every type. They are built in the background at startup.
+
+	The advisor samples the query shapes of data listings. A shape is the
+	filter with its values removed, plus the sort. Each new shape is
+	explained in the background, and shapes whose winning plan scans the
+	whole collection are logged and reported with a suggested compound
+	index. The suggestion follows the equality, sort, range rule.
+	"""
+
+	equality = ["$eq", "$in"]
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Indexes Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["indexes"]
+
+		self.shapes = {}
+		self.pending = []
+		self.lock = threading.Lock()
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Starts building the declared indexes and the advisor. """
+
+		threading.Thread(target=self.build, args=(), daemon=True).start()
+		if self.confs["advisor"]["enabled"]:
+			threading.Thread(target=self.advisor, args=(), daemon=True).start()
+
+		self.helpers.logger.info(self.program + " started.")
+
+	def build(self):
+		""" Builds the declared indexes of every type. """
+
+		for typeof in self.confs["types"]:
+			declared = self.confs["declared"].get("*", []) + \
+				self.confs["declared"].get(typeof, [])
+			collection = self.data.getCollection(typeof)
+			for keys in declared:
+				try:
+					name = collection.create_index([(key, direction)
+						for key, direction in keys], background=True)
+					self.helpers.logger.info(self.program + " index " + \
+						collection.name + "." + name + " ready")
+				except PyMongoError as e:
+					self.helpers.logger.error(self.program + " index on " + \
+						collection.name + " failed: " + str(e))
+
+	def shape(self, query):
+		""" Removes the values from a filter, keeping its fields and operators. """
+
+		if isinstance(query, dict):
+			if len(query) and all(key.startswith("$") for key in query):
+				return {key: self.shape(value) if key in ["$and", "$or", "$nor", "$not"]
+					else 1 for key, value in query.items()}
+			return {key: self.shape(value) for key, value in query.items()}
+		if isinstance(query, list):
+			return [self.shape(value) for value in query]
+
+		return 1
+
+	def sample(self, typeof, query, sort):
+		""" Records the shape of a data listing query.
+
+		New shapes are always recorded, known shapes are counted at
+		indexes.advisor.sampleRate.
+		"""
+
+		if not self.confs["advisor"]["enabled"]:
+			return
+
+		key = typeof + json.dumps([self.shape(query), sort], sort_keys=True)
+
+		with self.lock:
+			if key in self.shapes:
+				if random.random() < self.confs["advisor"]["sampleRate"]:
+					self.shapes[key]["Sampled"] += 1
+				return
+			if len(self.shapes) >= self.confs["advisor"]["maxShapes"]:
+				return
+			self.shapes[key] = {
+				"Type": typeof,
+				"Shape": self.shape(query),
+				"Sort": sort,
+				"Sampled": 1,
+				"Plan": None,
+				"Suggested": None
+			}
+			self.pending.append((key, query, sort))
+
+	def advisor(self):
+		""" Explains new query shapes every indexes.advisor.interval seconds. """
+
+		while True:
+			time.sleep(self.confs["advisor"]["interval"])
+
+			with self.lock:
+				pending = self.pending
+				self.pending = []
+
+			for key, query, sort in pending:
+				self.explain(key, query, sort)
+
+	def explain(self, key, query, sort):
+		""" Explains a query and records whether it scans the collection. """
+
+		shape = self.shapes[key]
+
+		try:
+			cursor = self.data.getCollection(shape["Type"]).find(query)
+			if len(sort):
+				cursor = cursor.sort(sort)
+			plan = cursor.explain()["queryPlanner"]["winningPlan"]
+		except (PyMongoError, KeyError, TypeError) as e:
+			self.helpers.logger.error(self.program + " explain failed: " + str(e))
+			return
+
+		stages = self.stages(plan)
+		shape["Plan"] = "COLLSCAN" if "COLLSCAN" in stages else \
+			"IXSCAN" if "IXSCAN" in stages else stages[0] if len(stages) else None
+
+		if shape["Plan"] == "COLLSCAN":
+			shape["Suggested"] = self.suggest(query, sort)
+			self.helpers.logger.warning(self.program + " COLLSCAN on " + \
+				shape["Type"] + " for " + json.dumps(shape["Shape"]) + " sort " + \
+				json.dumps(sort) + ", suggested index " + json.dumps(shape["Suggested"]))
+
+	def stages(self, plan):
+		""" Lists the stages of a query plan, outermost first. """
+
+		stages = [plan.get("stage")]
+		if "inputStage" in plan:
+			stages += self.stages(plan["inputStage"])
+		for stage in plan.get("inputStages", []):
+			stages += self.stages(stage)
+
+		return stages
+
+	def fields(self, query, equalities, ranges):
+		""" Sorts the fields of a filter into equality and range fields. """
+
+		for key, condition in query.items():
+			if key == "$and":
+				for subquery in condition:
+					self.fields(subquery, equalities, ranges)
+			elif key.startswith("$"):
+				continue
+			elif not isinstance(condition, dict) or \
+					all(operator in self.equality for operator in condition):
+				if key not in equalities:
+					equalities.append(key)
+			elif key not in ranges:
+				ranges.append(key)
+
+	def suggest(self, query, sort):
+		""" Suggests a compound index for a query.
+
+		Equality fields come first, then the sort fields, then the range
+		fields.
+		"""
+
+		equalities = []
+		ranges = []
+		self.fields(query, equalities, ranges)
+
+		keys = [[field, 1] for field in equalities]
+		for field, direction in sort:
+			if field not in equalities:
+				keys.append([field, direction])
+		for field in ranges:
+			if field not in [key[0] for key in keys]:
+				keys.append([field, 1])
+
+		return keys
+
+	def report(self):
+		""" Returns the advisor counters and the shapes that scan collections. """
+
+		with self.lock:
+			return {
+				"Shapes": len(self.shapes),
+				"Collscans": [shape for shape in self.shapes.values()
+					if shape["Plan"] == "COLLSCAN"]
+			}
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" HIASHDI Ingestion Module.
+
+This module stores HIAS iotJumpWay MQTT communications in the HIASHDI
+database. Messages are buffered per collection and written in batches
+when a size or time threshold is reached.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import threading
+import time
+
+
+class ingestion():
+	""" HIASHDI Ingestion Module.
+
+	This module stores HIAS iotJumpWay MQTT communications in the HIASHDI
+	database. Messages are buffered per collection and written in batches
+	when a size or time threshold is reached.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Ingestion Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["ingestion"]
+		self.batchSize = self.confs["batchSize"]
+		self.flushInterval = self.confs["flushInterval"]
+
+		self.buffers = {}
+		self.lock = threading.Lock()
+		self.running = False
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Starts the periodic buffer flushing. """
+
+		self.running = True
+		threading.Thread(target=self.flusher, args=(), daemon=True).start()
+
+		self.helpers.logger.info(self.program + " started.")
+
+	def stop(self):
+		""" Stops the periodic flushing and writes any buffered messages. """
+
+		self.running = False
+		self.flush()
+
+	def callback(self, topic, payload):
+		""" iotJumpWay MQTT callback.
+
+		Decodes a Sensors, Life, Status, Actuators or Commands message and
+		adds it to the buffer of its HIASHDI data type.
+		"""
+
+		splitTopic = topic.split("/")
+		if len(splitTopic) < 5 or splitTopic[4] not in self.confs["topics"]:
+			return
+
+		typeof = self.confs["topics"][splitTopic[4]]
+		entry = self.decode(splitTopic, payload)
+
+		# QoS 1 redeliveries carry the same topic, which names the entity,
+		# and payload. The key is made before the entry is given a Time, so
+		# it only holds a timestamp the payload carries.
+		dedupe = self.data.dedupe
+		if dedupe is not None and dedupe.applies(typeof) and dedupe.field not in entry:
+			if not isinstance(payload, bytes):
+				payload = str(payload).encode("utf-8")
+			entry[dedupe.field] = dedupe.digest(topic.encode("utf-8") + b"\n" + payload, entry)
+
+		entry.setdefault("Time", self.data.broker.now())
+
+		self.add(typeof, entry)
+
+	def decode(self, splitTopic, payload):
+		""" Converts an iotJumpWay MQTT message to a HIASHDI data entry. """
+
+		if isinstance(payload, bytes):
+			payload = payload.decode("utf-8", "replace")
+
+		try:
+			entry = json.loads(payload)
+		except ValueError:
+			entry = payload
+
+		if not isinstance(entry, dict):
+			entry = {splitTopic[4]: entry}
+
+		entry.setdefault("Use", splitTopic[1])
+		entry.setdefault("Location", splitTopic[0])
+		entry.setdefault("Zone", splitTopic[2])
+		entry.setdefault("Entity", splitTopic[3])
+
+		return entry
+
+	def add(self, typeof, entry):
+		""" Adds an entry to a buffer, flushing it when it is full. """
+
+		batch = None
+
+		with self.lock:
+			buffer = self.buffers.setdefault(typeof, [])
+			buffer.append(entry)
+			if len(buffer) >= self.batchSize:
+				batch = buffer
+				self.buffers[typeof] = []
+
+		if batch is not None:
+			self.write(typeof, batch)
+
+	def flush(self):
+		""" Writes all buffered entries. """
+
+		with self.lock:
+			buffers = self.buffers
+			self.buffers = {}
+
+		for typeof in buffers:
+			if len(buffers[typeof]):
+				self.write(typeof, buffers[typeof])
+
+	def flusher(self):
+		""" Flushes the buffers every flushInterval seconds. """
+
+		while self.running:
+			time.sleep(self.flushInterval)
+			self.flush()
+
+	def write(self, typeof, batch):
+		""" Writes a batch of entries to the database. """
+
+		try:
+			ids, errors = self.data.insertDatas(typeof, batch)
+			self.helpers.logger.info(self.program + " stored " + \
+				str(len([_id for _id in ids if _id is not None])) + " " + typeof + " entries")
+			for i in errors:
+				self.helpers.logger.error(self.program + " " + typeof + \
+					" entry not stored: " + errors[i])
+		except Exception as e:
+			self.helpers.logger.error(self.program + " " + typeof + \
+				" batch of " + str(len(batch)) + " not stored: " + str(e))
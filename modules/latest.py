@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+""" HIASHDI Latest Values Module.
+
+This module maintains a collection with the latest value of every
+attribute of every entity, updated as data is written.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+class latest():
+	""" HIASHDI Latest Values Module.
+
+	This module maintains a collection with the latest value of every
+	attribute of every entity, updated as data is written.
+
+	Each data type has its own collection, named with the configured prefix,
+	holding one document per entity with a unique index on the entity
+	field. A written batch is merged per entity and applied as one unordered
+	bulk of pipeline upserts. The time each attribute was last set is kept
+	in Times, and each attribute is only set when the data is not older than
+	its time there, so late data such as spill replays still updates the
+	attributes it has newer values of. Upserts that race to create the same
+	entity fail on the unique index and are retried as updates.
+
+	Reading the current value of an entity is then an index lookup, however
+	long its history is.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Latest Values Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["latest"]
+		self.timeField = self.helpers.confs["data"]["timeField"]
+		self.entityField = self.helpers.confs["data"]["entityField"]
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Creates the unique entity indexes. """
+
+		for typeof in self.confs["types"]:
+			try:
+				self.getCollection(typeof).create_index(
+					self.entityField, unique=True, background=True)
+			except PyMongoError as e:
+				self.helpers.logger.error(self.program + " " + typeof + \
+					" index not created: " + str(e))
+
+		self.helpers.logger.info(self.program + " started.")
+
+	def applies(self, typeof):
+		""" Whether latest values are kept for a data type. """
+
+		return typeof in self.confs["types"]
+
+	def getCollection(self, typeof):
+		""" Gets the latest values collection of a data type. """
+
+		return self.data.mongodb.mongoConn[self.confs["prefix"] + typeof]
+
+	def time(self, entry):
+		""" Gets the time of an entry, or now if it has none. """
+
+		time = entry.get(self.timeField)
+		if isinstance(time, (datetime, str)):
+			try:
+				return self.data.broker.castTime(time)
+			except ValueError:
+				pass
+
+		return self.data.broker.now()
+
+	def merge(self, batch):
+		""" Merges a batch into the newest values of each entity. """
+
+		entities = {}
+
+		for entry in batch:
+			entity = entry.get(self.entityField)
+			if not isinstance(entity, str):
+				continue
+
+			time = self.time(entry)
+			values, times = entities.setdefault(entity, ({}, {}))
+			for attr, value in entry.items():
+				if attr in ["_id", "Times", self.entityField, self.timeField] or \
+						attr in self.confs["exclude"] or \
+						attr.startswith("$") or "." in attr:
+					continue
+				if attr not in times or times[attr] <= time:
+					values[attr] = value
+					times[attr] = time
+
+		return entities
+
+	def operation(self, entity, values, times):
+		""" Builds the pipeline upsert of the newest values of an entity. """
+
+		update = {
+			self.timeField: {"$max": ["$" + self.timeField, max(times.values())]}
+		}
+		for attr, value in values.items():
+			stored = "$Times." + attr
+			# A missing time sorts before any date, so new attributes are set
+			update[attr] = {"$cond": [{"$gt": [stored, times[attr]]},
+				"$" + attr, {"$literal": value}]}
+			update["Times." + attr] = {"$max": [stored, times[attr]]}
+
+		return UpdateOne({self.entityField: entity}, [{"$set": update}], upsert=True)
+
+	def update(self, typeof, batch, errors=[]):
+		""" Updates the latest values with the stored entries of a batch. """
+
+		if not self.applies(typeof):
+			return
+
+		failed = set(error["index"] for error in errors)
+		entities = self.merge([entry for i, entry in enumerate(batch) if i not in failed])
+
+		operations = [self.operation(entity, values, times)
+			for entity, (values, times) in entities.items() if len(times)]
+
+		for attempt in range(self.confs["retries"] + 1):
+			if not len(operations):
+				return
+			try:
+				self.getCollection(typeof).bulk_write(operations, ordered=False)
+				return
+			except BulkWriteError as e:
+				retries = []
+				for error in e.details["writeErrors"]:
+					if error["code"] == 11000:
+						# Another upsert created the entity first
+						retries.append(operations[error["index"]])
+					else:
+						self.helpers.logger.error(self.program + " " + typeof + \
+							" latest value not updated: " + error["errmsg"])
+				operations = retries
+			except PyMongoError as e:
+				self.helpers.logger.error(self.program + " " + typeof + \
+					" latest values not updated: " + str(e))
+				return
+
+		self.helpers.logger.error(self.program + " " + typeof + " latest values of " + \
+			str(len(operations)) + " entities not updated after retries")
@@ -33,8 +33,10 @@ Contributors:
 """
 
 import sys
+import time
 
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 
 class mongodb():
 	""" HIASCHDI MongoDB Helper Module.
@@ -52,6 +54,8 @@ class mongodb():
 		self.confs = self.helpers.confs
 		self.credentials = self.helpers.credentials
 
+		self.healthy = True
+
 		self.helpers.logger.info(self.program + " initialization complete.")
 
 	def start(self):
@@ -83,3 +87,21 @@ class mongodb():
 			"Thing": self.mongoConn.Entities,
 			"Zone": self.mongoConn.Entities
 		}
+
+	def ping(self):
+		""" Checks the HIAS MongoDB database is reachable.
+
+		Returns the round trip time in seconds, or None if the database
+		could not be reached.
+		"""
+
+		try:
+			start = time.monotonic()
+			self.mongoCon.admin.command("ping")
+			self.healthy = True
+			return time.monotonic() - start
+		except PyMongoError as e:
+			if self.healthy:
+				self.helpers.logger.error(self.program + " ping failed: " + str(e))
+			self.healthy = False
+			return None
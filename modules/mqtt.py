@@ -33,9 +33,12 @@ Contributors:
 """
 
 import json
+import threading
 
 import paho.mqtt.client as pmqtt
 
+from collections import deque
+
 class mqtt():
 	"""HIAS iotJumpWay MQTT Module
 
@@ -52,6 +55,8 @@ class mqtt():
 		self.configs = configs
 		self.client_type = client_type
 		self.isConnected = False
+		# QoS of the channel subscription, renewed on every connection
+		self.subscription = None
 
 		self.helpers = helpers
 		self.program = "HIAS iotJumpWay MQTT Module"
@@ -59,6 +64,14 @@ class mqtt():
 		self.mqtt_config = {}
 		self.module_topics = {}
 
+		# Bounded work queue between the paho network thread and the handlers
+		self.queue_config = self.helpers.confs["mqtt"]["queue"]
+		self.queue = deque()
+		self.queueCondition = threading.Condition()
+		self.received = 0
+		self.processed = 0
+		self.dropped = {}
+
 		self.hiashdi = [
 			'host',
 			'port',
@@ -118,6 +131,7 @@ class mqtt():
 		self.mClient.will_set(self.module_topics["statusTopic"], "OFFLINE", 0, False)
 		self.mClient.tls_set(self.mqtt_config["tls"], certfile=None, keyfile=None)
 		self.mClient.on_connect = self.on_connect
+		self.mClient.on_disconnect = self.on_disconnect
 		self.mClient.on_message = self.on_message
 		self.mClient.on_publish = self.on_publish
 		self.mClient.on_subscribe = self.on_subscribe
@@ -125,13 +139,17 @@ class mqtt():
 		self.mClient.connect(self.mqtt_config["host"], self.mqtt_config["port"], 10)
 		self.mClient.loop_start()
 
+		for i in range(self.queue_config["workers"]):
+			threading.Thread(target=self.worker, args=(), daemon=True).start()
+
 		self.helpers.logger.info(
 					"iotJumpWay " + self.client_type + " connection started.")
 
 	def on_connect(self, client, obj, flags, rc):
 		""" On connection
 
-		On connection callback.
+		On connection callback. The session is clean, so the broker has no
+		subscriptions after a reconnect and they are made again here.
 		"""
 
 		if self.isConnected != True:
@@ -140,8 +158,22 @@ class mqtt():
 			self.helpers.logger.info("iotJumpWay " + self.client_type + " connection successful.")
 			self.helpers.logger.info("rc: " + str(rc))
 
+			if self.subscription is not None:
+				self.subscribeChannels()
+
 			self.statusPublish("ONLINE")
 
+	def on_disconnect(self, client, obj, rc):
+		""" On disconnection
+
+		On disconnection callback.
+		"""
+
+		self.isConnected = False
+
+		self.helpers.logger.warning("iotJumpWay " + self.client_type + \
+			" connection lost, rc: " + str(rc))
+
 	def statusPublish(self, data):
 		""" Status publish
 
@@ -162,7 +194,102 @@ class mqtt():
 	def on_message(self, client, obj, msg):
 		""" On message
 
-		On message callback.
+		On message callback. Queues the message for the worker threads so
+		the paho network thread is never blocked by a slow handler.
+		"""
+
+		splitTopic = msg.topic.split("/")
+		topic = splitTopic[4] if len(splitTopic) > 4 else ""
+		priority = self.queue_config["priorities"].get(
+			topic, self.queue_config["defaultPriority"])
+		policy = self.queue_config["overflowPolicy"]
+
+		with self.queueCondition:
+			self.received += 1
+
+			if len(self.queue) >= self.queue_config["size"]:
+				if policy == "block":
+					self.queueCondition.wait_for(
+						lambda: len(self.queue) < self.queue_config["size"],
+						self.queue_config["blockTimeout"])
+				elif policy == "dropOldest":
+					self.drop(self.queue.popleft()[1])
+				elif policy == "priority":
+					self.dropLowest(priority)
+
+			if len(self.queue) >= self.queue_config["size"]:
+				self.drop(topic)
+				return
+
+			self.queue.append((priority, topic, msg))
+			self.queueCondition.notify_all()
+
+	def dropLowest(self, priority):
+		""" Drop lowest
+
+		Drops the oldest queued message with the lowest priority, if it has
+		a lower priority than the incoming message.
+		"""
+
+		lowest = None
+		for i, entry in enumerate(self.queue):
+			if entry[0] < priority and (lowest is None or entry[0] < self.queue[lowest][0]):
+				lowest = i
+
+		if lowest is not None:
+			self.drop(self.queue[lowest][1])
+			del self.queue[lowest]
+
+	def drop(self, topic):
+		""" Drop
+
+		Counts a message dropped by the overflow policy.
+		"""
+
+		self.dropped[topic] = self.dropped.get(topic, 0) + 1
+
+	def worker(self):
+		""" Worker
+
+		Processes queued messages.
+		"""
+
+		while True:
+			with self.queueCondition:
+				self.queueCondition.wait_for(lambda: len(self.queue))
+				priority, topic, msg = self.queue.popleft()
+				self.queueCondition.notify_all()
+
+			try:
+				self.process(msg)
+			except Exception as e:
+				self.helpers.logger.error("iotJumpWay " + msg.topic + \
+					" communication failed: " + str(e))
+
+			with self.queueCondition:
+				self.processed += 1
+
+	def queueStats(self):
+		""" Queue stats
+
+		Returns the work queue depth and counters.
+		"""
+
+		with self.queueCondition:
+			return {
+				"Depth": len(self.queue),
+				"Size": self.queue_config["size"],
+				"OverflowPolicy": self.queue_config["overflowPolicy"],
+				"Received": self.received,
+				"Processed": self.processed,
+				"Dropped": sum(self.dropped.values()),
+				"DroppedByTopic": dict(self.dropped)
+			}
+
+	def process(self, msg):
+		""" Process
+
+		Routes a message to its callback.
 		"""
 
 		splitTopic = msg.topic.split("/")
@@ -247,13 +374,21 @@ class mqtt():
 	def subscribe(self, application = None, channelID = None, qos=0):
 		""" Subscribe
 
-		Subscribes to an iotJumpWay MQTT channel.
+		Subscribes to an iotJumpWay MQTT channel, now if connected and
+		again on every connection.
 		"""
 
+		self.subscription = qos
+		if self.isConnected:
+			self.subscribeChannels()
+		return True
+
+	def subscribeChannels(self):
+		""" Subscribes to all channels of the location. """
+
 		channel = '%s/#' % (self.configs['location'])
-		self.mClient.subscribe(channel, qos=qos)
+		self.mClient.subscribe(channel, qos=self.subscription)
 		self.helpers.logger.info("-- Agent subscribed to all channels")
-		return True
 
 	def on_publish(self, client, obj, mid):
 		""" On publish
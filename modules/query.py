@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+""" HIASHDI Query Module.
+
+This module compiles NGSI v2 Simple Query Language expressions, as used
+by the q parameter, into MongoDB filters.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import re
+import threading
+
+from collections import OrderedDict
+
+
+class query():
+	""" HIASHDI Query Module.
+
+	This module compiles NGSI v2 Simple Query Language expressions, as used
+	by the q parameter, into MongoDB filters.
+
+	Grammar:
+
+		query     = statement *( ";" statement )
+		statement = clause *( "||" clause )
+		clause    = attribute / "!" attribute / attribute operator values
+		operator  = "==" / ":" / "!=" / ">=" / "<=" / ">" / "<" / "~="
+		values    = value *( "," value ) / value ".." value
+
+	Values in single or double quotes are taken literally, other values
+	are cast to bool, float or int where possible. Separators inside quotes
+	are part of the value. "||" is a HIASHDI extension that ORs clauses.
+
+	Compiled filters are kept in a bounded LRU cache keyed by the query
+	string. Callers are given copies, so they can extend them freely.
+	"""
+
+	# Two character operators are listed first so they win over > and <
+	operators = re.compile(r"==|!=|>=|<=|~=|>|<|:|['\"]")
+
+	def __init__(self, helpers, broker):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Query Module"
+
+		self.broker = broker
+
+		self.cacheSize = self.helpers.confs["query"]["cacheSize"]
+		self.cache = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def compile(self, expression):
+		""" Compiles a q expression into a MongoDB filter.
+
+		Raises ValueError if the expression cannot be parsed.
+		"""
+
+		key = expression.strip()
+
+		with self.lock:
+			if key in self.cache:
+				self.cache.move_to_end(key)
+				self.hits += 1
+				return self.copy(self.cache[key])
+			self.misses += 1
+
+		compiled = self.parse(key)
+
+		with self.lock:
+			self.cache[key] = compiled
+			if len(self.cache) > self.cacheSize:
+				self.cache.popitem(last=False)
+
+		return self.copy(compiled)
+
+	def copy(self, compiled):
+		""" Copies the dicts and lists of a filter, values are immutable. """
+
+		if isinstance(compiled, dict):
+			return {key: self.copy(value) for key, value in compiled.items()}
+		if isinstance(compiled, list):
+			return [self.copy(value) for value in compiled]
+		return compiled
+
+	def parse(self, expression):
+		""" Parses a q expression into a MongoDB filter. """
+
+		compiled = {}
+		conditions = []
+
+		for statement in self.split(expression, ";"):
+			if statement.strip() == "":
+				continue
+
+			clauses = [self.clause(clause) for clause in self.split(statement, "||")]
+			if len(clauses) > 1:
+				conditions.append({"$or": clauses})
+			else:
+				conditions.append(clauses[0])
+
+		# Keeps conditions top level where possible so indexes and other
+		# filters can see them, and falls back to $and for repeats
+		for condition in conditions:
+			key = next(iter(condition))
+			if key in compiled:
+				compiled.setdefault("$and", []).append(condition)
+			else:
+				compiled.update(condition)
+
+		return compiled
+
+	def split(self, text, separator):
+		""" Splits text on a separator that is not inside quotes. """
+
+		if "'" not in text and '"' not in text:
+			return text.split(separator)
+
+		parts = []
+		quote = None
+		start = 0
+		i = 0
+
+		while i < len(text):
+			character = text[i]
+			if quote is not None:
+				if character == quote:
+					quote = None
+			elif character in "'\"":
+				quote = character
+			elif text.startswith(separator, i):
+				parts.append(text[start:i])
+				i += len(separator)
+				start = i
+				continue
+			i += 1
+
+		if quote is not None:
+			raise ValueError("Unterminated quote in q: " + text)
+
+		parts.append(text[start:])
+
+		return parts
+
+	def clause(self, clause):
+		""" Compiles a single clause. """
+
+		clause = clause.strip()
+
+		# Finds the leftmost operator, attribute names cannot hold quotes
+		match = self.operators.search(clause)
+		if match is not None and match.group() not in "'\"":
+			attribute = clause[:match.start()].strip()
+			values = clause[match.end():].strip()
+			if attribute == "" or values == "" or "=" in attribute:
+				raise ValueError("Invalid q clause: " + clause)
+
+			return {attribute: self.condition(match.group(), values)}
+
+		# Unary clauses test for the existence of an attribute, a single =
+		# is not an operator so it cannot be part of their names
+		if clause.startswith("!") and clause[1:].strip() != "" and "=" not in clause:
+			return {clause[1:].strip(): {"$exists": False}}
+		if clause != "" and not any(character in clause for character in "!'\"="):
+			return {clause: {"$exists": True}}
+
+		raise ValueError("Invalid q clause: " + clause)
+
+	def condition(self, operator, values):
+		""" Compiles the operator and values of a clause. """
+
+		if operator == "~=":
+			return {"$regex": self.literal(values)}
+
+		if operator in ["==", ":", "!="]:
+			bounds = self.split(values, "..")
+			if len(bounds) == 2:
+				condition = {
+					"$gte": self.value(bounds[0]),
+					"$lte": self.value(bounds[1])
+				}
+				return condition if operator != "!=" else {"$not": condition}
+
+			items = [self.value(item) for item in self.split(values, ",")]
+			if operator != "!=":
+				return {"$in": items}
+			if len(items) == 1:
+				return {"$ne": items[0]}
+			return {"$nin": items}
+
+		value = self.value(values)
+
+		if operator == ">":
+			return {"$gt": value}
+		elif operator == ">=":
+			return {"$gte": value}
+		elif operator == "<":
+			return {"$lt": value}
+		else:
+			return {"$lte": value}
+
+	def literal(self, value):
+		""" Removes the quotes of a quoted value. """
+
+		value = value.strip()
+		if len(value) > 1 and value[0] in "'\"" and value[-1] == value[0]:
+			return value[1:-1]
+		return value
+
+	def value(self, value):
+		""" Converts a value, casting it unless it is quoted. """
+
+		value = value.strip()
+		if len(value) > 1 and value[0] in "'\"" and value[-1] == value[0]:
+			return value[1:-1]
+		return self.broker.cast(value)
+
+	def stats(self):
+		""" Returns the query plan cache counters. """
+
+		with self.lock:
+			return {
+				"Size": len(self.cache),
+				"Hits": self.hits,
+				"Misses": self.misses
+			}
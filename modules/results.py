@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+""" HIASHDI Results Module.
+
+This module caches the responses of data listings, so dashboards
+polling the same query do not repeat it.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+from flask import Response
+
+
+class results():
+	""" HIASHDI Results Module.
+
+	This module caches the responses of data listings, so dashboards
+	polling the same query do not repeat it.
+
+	Responses are cached as their serialized bodies, keyed by the type,
+	the request arguments in a canonical order and the accepted types.
+	Entries expire after results.ttl seconds, and the least recently used
+	entries are evicted beyond results.maxEntries entries or
+	results.maxBytes bytes of bodies.
+
+	Each entry records the write generation of its type's collection when
+	its query started, so any write to it makes the entry stale at once.
+	"""
+
+	def __init__(self, helpers, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Results Module"
+
+		self.data = data
+
+		self.confs = self.helpers.confs["results"]
+
+		self.cache = OrderedDict()
+		self.size = 0
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def key(self, arguments, accepted):
+		""" Cache key of a listing, equal for equal arguments in any order. """
+
+		if hasattr(arguments, "getlist"):
+			items = sorted(arguments.items(multi=True))
+		else:
+			items = sorted(arguments.items())
+
+		return json.dumps([items, sorted(accepted)])
+
+	def get(self, typeof, key):
+		""" Gets a cached response, or None. """
+
+		generation = self.data.generation(self.data.getCollection(typeof).name)
+
+		with self.lock:
+			entry = self.cache.get(key)
+			if entry is None or entry["generation"] != generation or \
+					entry["expires"] < time.time():
+				if entry is not None:
+					self.evict(key)
+				self.misses += 1
+				return None
+
+			self.cache.move_to_end(key)
+			self.hits += 1
+
+		response = Response(response=entry["body"], status=entry["status"])
+		response.headers = dict(entry["headers"])
+
+		return response
+
+	def put(self, typeof, key, generation, response):
+		""" Caches a response of a listing started at a write generation. """
+
+		if response.status_code not in [200, 404] or response.is_streamed:
+			return
+
+		body = response.get_data()
+		if len(body) > self.confs["maxBytes"]:
+			return
+
+		with self.lock:
+			if key in self.cache:
+				self.evict(key)
+
+			self.cache[key] = {
+				"generation": generation,
+				"expires": time.time() + self.confs["ttl"],
+				"status": response.status_code,
+				"headers": dict(response.headers),
+				"body": body
+			}
+			self.size += len(body)
+
+			while len(self.cache) > self.confs["maxEntries"] or \
+					self.size > self.confs["maxBytes"]:
+				self.evict(next(iter(self.cache)))
+
+	def evict(self, key):
+		""" Removes an entry, the caller holds the lock. """
+
+		entry = self.cache.pop(key)
+		self.size -= len(entry["body"])
+
+	def stats(self):
+		""" Returns the result cache counters and memory use. """
+
+		with self.lock:
+			lookups = self.hits + self.misses
+			return {
+				"Size": len(self.cache),
+				"Bytes": self.size,
+				"Hits": self.hits,
+				"Misses": self.misses,
+				"HitRatio": round(self.hits / lookups, 4) if lookups else None
+			}
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+""" HIASHDI Spill Log Module.
+
+This module provides an append-only, memory-mapped, segment-based write
+ahead log. Data entries are spilled to the log while MongoDB is down or
+slow, and are replayed in bulk once MongoDB recovers.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import bson
+import mmap
+import os
+import struct
+import threading
+import time
+
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+
+
+class spill():
+	""" HIASHDI Spill Log Module.
+
+	This module provides an append-only, memory-mapped, segment-based write
+	ahead log. Data entries are spilled to the log while MongoDB is down or
+	slow, and are replayed in bulk once MongoDB recovers.
+
+	Each segment is a preallocated file holding BSON records of the form
+	{"t": type, "d": [entries]} back to back. A zero length marks the end
+	of the written part of a segment.
+
+	Replay progress is saved after every batch in a .progress file next to
+	the segment, holding the position of the record being replayed and the
+	number of its entries already inserted. An interrupted replay resumes
+	from there, so only the batch in flight can be inserted twice.
+	"""
+
+	def __init__(self, helpers, mongodb, data):
+		""" Initializes the class. """
+
+		self.helpers = helpers
+		self.program = "HIASHDI Spill Log Module"
+
+		self.mongodb = mongodb
+		self.data = data
+
+		self.confs = self.helpers.confs["spill"]
+		self.directory = os.path.join(
+			os.path.dirname(os.path.abspath(__file__)), "..", self.confs["directory"])
+
+		self.lock = threading.Lock()
+		self.latencyLock = threading.Lock()
+		self.slow = False
+		self.slowSamples = 0
+		self.segment = None
+		self.segmentMap = None
+		self.position = 0
+		self.dirty = False
+		self.spilled = 0
+		self.replayed = 0
+
+		os.makedirs(self.directory, exist_ok=True)
+
+		self.helpers.logger.info(self.program + " initialization complete.")
+
+	def start(self):
+		""" Starts the health monitor, fsync and replay threads. """
+
+		threading.Thread(target=self.monitor, args=(), daemon=True).start()
+		if self.confs["fsync"] == "interval":
+			threading.Thread(target=self.syncer, args=(), daemon=True).start()
+
+		self.helpers.logger.info(self.program + " started.")
+
+	def spilling(self):
+		""" Whether writes should currently go to the spill log. """
+
+		return self.mongodb.healthy is False or self.slow
+
+	def recordLatency(self, latency):
+		""" Records the latency of a MongoDB write.
+
+		Writes are spilled once latencySamples writes in a row are over the
+		threshold, so a single slow write does not switch to spilling.
+		"""
+
+		with self.latencyLock:
+			if latency <= self.confs["latencyThreshold"]:
+				self.slowSamples = 0
+				return
+
+			self.slowSamples += 1
+			if self.slowSamples < self.confs["latencySamples"] or self.slow:
+				return
+			self.slow = True
+
+		self.helpers.logger.warning(self.program + " write latency " + \
+			str(round(latency, 3)) + "s over threshold for " + \
+			str(self.confs["latencySamples"]) + " writes, spilling writes")
+
+	def write(self, typeof, datas):
+		""" Appends entries to the spill log.
+
+		Entries are given an _id first, so the caller can return it and a
+		replay that is interrupted can safely be repeated.
+		"""
+
+		for entry in datas:
+			if "_id" not in entry:
+				entry["_id"] = ObjectId()
+
+		record = bson.encode({"t": typeof, "d": datas})
+
+		with self.lock:
+			if self.segmentMap is None or \
+					self.position + len(record) + 4 > len(self.segmentMap):
+				self.rotate(len(record) + 4)
+
+			self.segmentMap[self.position:self.position + len(record)] = record
+			self.position += len(record)
+			self.dirty = True
+			self.spilled += len(datas)
+
+			if self.confs["fsync"] == "always":
+				self.segmentMap.flush()
+				self.dirty = False
+
+		return [entry["_id"] for entry in datas], {}
+
+	def rotate(self, size=0):
+		""" Seals the active segment and opens a new one. """
+
+		self.seal()
+
+		segments = self.segments()
+		sequence = int(segments[-1].split(".")[0]) + 1 if len(segments) else 0
+
+		self.segment = os.path.join(self.directory, "%020d.log" % sequence)
+		with open(self.segment, "wb") as f:
+			f.truncate(max(self.confs["segmentSize"], size))
+		with open(self.segment, "r+b") as f:
+			self.segmentMap = mmap.mmap(f.fileno(), 0)
+		self.position = 0
+
+	def seal(self):
+		""" Flushes and closes the active segment. """
+
+		if self.segmentMap is not None:
+			self.segmentMap.flush()
+			self.segmentMap.close()
+			self.segmentMap = None
+			self.segment = None
+			self.dirty = False
+
+	def segments(self):
+		""" Lists the segment files, oldest first. """
+
+		return sorted(f for f in os.listdir(self.directory) if f.endswith(".log"))
+
+	def records(self, path, position=0):
+		""" Reads the records of a sealed segment from a position, yielding
+		the position of each record with it. """
+
+		with open(path, "rb") as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				return
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segmentMap:
+				while position + 4 <= len(segmentMap):
+					length = struct.unpack_from("<i", segmentMap, position)[0]
+					if length <= 0 or position + length > len(segmentMap):
+						break
+					yield position, bson.decode(segmentMap[position:position + length])
+					position += length
+
+	def progress(self, path):
+		""" Reads the replay progress of a segment as (position, entries). """
+
+		try:
+			with open(path + ".progress", "rb") as f:
+				return struct.unpack("<qq", f.read(16))
+		except (OSError, struct.error):
+			return 0, 0
+
+	def saveProgress(self, path, position, entries):
+		""" Saves the replay progress of a segment, replacing it atomically. """
+
+		with open(path + ".progress.tmp", "wb") as f:
+			f.write(struct.pack("<qq", position, entries))
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(path + ".progress.tmp", path + ".progress")
+
+	def syncer(self):
+		""" Flushes the active segment every fsyncInterval seconds. """
+
+		while True:
+			time.sleep(self.confs["fsyncInterval"])
+			with self.lock:
+				if self.dirty and self.segmentMap is not None:
+					self.segmentMap.flush()
+					self.dirty = False
+
+	def monitor(self):
+		""" Checks MongoDB health and replays the log once it recovers. """
+
+		while True:
+			latency = self.mongodb.ping()
+			if latency is not None and latency <= self.confs["latencyThreshold"]:
+				if self.slow:
+					self.helpers.logger.info(self.program + " write latency recovered")
+				with self.latencyLock:
+					self.slow = False
+					self.slowSamples = 0
+
+			if not self.spilling():
+				with self.lock:
+					if self.position:
+						self.seal()
+				if len(self.segments()):
+					self.replay()
+
+			time.sleep(self.confs["healthInterval"])
+
+	def replay(self):
+		""" Replays sealed segments into MongoDB at a limited rate. """
+
+		for name in self.segments():
+			path = os.path.join(self.directory, name)
+			if path == self.segment:
+				continue
+
+			start, done = self.progress(path)
+			if start or done:
+				self.helpers.logger.info(self.program + " resuming segment " + name + \
+					" at " + str(start) + " after " + str(done) + " entries")
+
+			try:
+				for position, record in self.records(path, start):
+					batchSize = self.confs["replayBatchSize"]
+					for i in range(done if position == start else 0, len(record["d"]), batchSize):
+						if self.spilling():
+							return
+						batch = record["d"][i:i + batchSize]
+						self.insert(record["t"], batch)
+						self.replayed += len(batch)
+						self.saveProgress(path, position, i + len(batch))
+						time.sleep(len(batch) / self.confs["replayRate"])
+			except PyMongoError as e:
+				self.helpers.logger.error(self.program + " replay stopped: " + str(e))
+				self.mongodb.healthy = False
+				return
+
+			os.remove(path)
+			if os.path.exists(path + ".progress"):
+				os.remove(path + ".progress")
+			self.helpers.logger.info(self.program + " replayed segment " + name)
+
+	def insert(self, typeof, batch):
+		""" Inserts a replayed batch, skipping entries already stored. """
+
+		for error in self.data.writeDatas(typeof, batch):
+			if error["code"] != 11000:
+				self.helpers.logger.error(self.program + " " + typeof + \
+					" entry not replayed: " + error["errmsg"])
+
+	def stats(self):
+		""" Returns the spill log state and counters. """
+
+		return {
+			"Spilling": self.spilling(),
+			"Segments": len(self.segments()),
+			"Spilled": self.spilled,
+			"Replayed": self.replayed
+		}
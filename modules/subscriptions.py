@@ -107,7 +107,38 @@ class subscriptions():
 		else:
 			limit = int(arguments.get('limit'))
 
-		if offset:
+		# Prepares keyset pagination, an empty cursor requests the first page
+		cursor = arguments.get('cursor')
+		if cursor is not None and offset:
+			self.helpers.logger.info(
+				self.program + " 400: cursor cannot be combined with offset")
+			return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+								{}, False, accepted)
+
+		if cursor is not None:
+			sort = self.broker.cursorSort([])
+			pageQuery = query
+			if cursor != "":
+				try:
+					pageQuery = dict(query, **self.broker.cursorFilter(cursor, sort))
+				except ValueError as e:
+					self.helpers.logger.info(self.program + " 400: " + str(e))
+					return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+										{}, False, accepted)
+
+			# The _id is needed to create the next token
+			del fields["_id"]
+			if fields == {}:
+				fields = None
+			subscriptions = list(self.mongodb.mongoConn.Subscriptions.find(
+				pageQuery, fields).sort(sort).limit(limit))
+
+			if limit and len(subscriptions) == limit:
+				# Sets the continuation token header
+				headers["Next-Cursor"] = self.broker.encodeCursor(sort, subscriptions[-1])
+			for entity in subscriptions:
+				del entity["_id"]
+		elif offset:
 			subscriptions = self.mongodb.mongoConn.Subscriptions.find(
 				query, fields).skip(offset).limit(limit)
 		else:
@@ -116,7 +147,10 @@ class subscriptions():
 
 		if count_opt:
 			# Sets count header
-			headers["Count"] = subscriptions.count()
+			if cursor is None:
+				headers["Count"] = subscriptions.count()
+			else:
+				headers["Count"] = self.mongodb.mongoConn.Subscriptions.count_documents(query)
 
 		return self.broker.respond(200, subscriptions, headers, False, accepted)
 
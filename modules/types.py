@@ -106,7 +106,38 @@ class types():
 		else:
 			limit = int(arguments.get('limit'))
 
-		if offset:
+		# Prepares keyset pagination, an empty cursor requests the first page
+		cursor = arguments.get('cursor')
+		if cursor is not None and offset:
+			self.helpers.logger.info(
+				self.program + " 400: cursor cannot be combined with offset")
+			return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+								{}, False, accepted)
+
+		if cursor is not None:
+			sort = self.broker.cursorSort([])
+			pageQuery = query
+			if cursor != "":
+				try:
+					pageQuery = dict(query, **self.broker.cursorFilter(cursor, sort))
+				except ValueError as e:
+					self.helpers.logger.info(self.program + " 400: " + str(e))
+					return self.broker.respond(400, self.helpers.confs["errorMessages"]["400p"],
+										{}, False, accepted)
+
+			# The _id is needed to create the next token
+			del fields["_id"]
+			if fields == {}:
+				fields = None
+			types = list(self.mongodb.mongoConn.Types.find(
+				pageQuery, fields).sort(sort).limit(limit))
+
+			if limit and len(types) == limit:
+				# Sets the continuation token header
+				headers["Next-Cursor"] = self.broker.encodeCursor(sort, types[-1])
+			for entity in types:
+				del entity["_id"]
+		elif offset:
 			types = self.mongodb.mongoConn.Types.find(
 				query, fields).skip(offset).limit(limit)
 		else:
@@ -115,7 +146,10 @@ class types():
 
 		if count_opt:
 			# Sets count header
-			headers["Count"] = types.count()
+			if cursor is None:
+				headers["Count"] = types.count()
+			else:
+				headers["Count"] = self.mongodb.mongoConn.Types.count_documents(query)
 
 		if values_opt:
 			# Converts data to values
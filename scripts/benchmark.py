@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" HIASHDI Response Encoder Benchmark.
+
+Compares the single pass response encoder of the HIASHDI Broker Module
+with the previous json_util.dumps, json.loads, json.dumps chain, using
+Sensors payloads.
+
+Usage: python3 scripts/benchmark.py [entries]
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import datetime
+import json
+import os
+import random
+import sys
+import timeit
+
+from bson import json_util, ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.broker import broker
+from modules.helpers import helpers
+
+
+def sensors(entries):
+	""" Creates Sensors entries shaped like those stored by iotJumpWay. """
+
+	now = datetime.datetime.now()
+	datas = []
+	for i in range(entries):
+		datas.append({
+			"_id": ObjectId(),
+			"Use": "Device",
+			"Location": str(ObjectId()),
+			"Zone": str(ObjectId()),
+			"Entity": str(ObjectId()),
+			"Sensor": "Temperature",
+			"Type": "Temperature",
+			"Value": round(random.uniform(15, 30), 2),
+			"Message": "Temperature reading",
+			"Time": now + datetime.timedelta(seconds=i)
+		})
+
+	return datas
+
+
+def main():
+
+	entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+	encoder = broker(helpers("Benchmark", False), None)
+	datas = sensors(entries)
+
+	runs = [
+		("previous", lambda: json.dumps(json.loads(json_util.dumps(datas)), indent=4)),
+		("compact", lambda: encoder.encode(datas)),
+		("pretty", lambda: encoder.encode(datas, True))
+	]
+
+	print(str(entries) + " Sensors entries")
+	for name, run in runs:
+		seconds = min(timeit.repeat(run, number=10, repeat=5)) / 10
+		print("%-10s %8.2f ms %10d bytes" % (name, seconds * 1000, len(run())))
+
+
+if __name__ == "__main__":
+	main()
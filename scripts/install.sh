@@ -10,12 +10,15 @@ if [ "$proceed" = "Y" -o "$proceed" = "y" ]; then
 	printf -- 'Installing the HIAS Historical Data Interface component....\n';
 	conda install flask
 	conda install -c conda-forge paho-mqtt
+	conda install numpy
 	conda install pandas
 	conda install psutil
+	conda install -c conda-forge pyarrow
 	conda install pymongo
 	conda install requests
 	conda install urllib3
 	pip install mgoquery
+	pip install zstandard
 	printf -- '\033[32m SUCCESS: HIAS Historical Data Interface component installed successfully! \033[0m\n';
 	exit 0
 else
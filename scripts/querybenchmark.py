@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+""" HIASHDI Query Benchmark.
+
+Compares the q parameter compiler of the HIASHDI Query Module, with and
+without its plan cache, with the previous chain of string splits.
+
+Usage: python3 scripts/querybenchmark.py [expression]
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from modules.broker import broker
+from modules.helpers import helpers
+from modules.query import query
+
+
+def previous(expression, caster):
+	""" The previous q handling of getDatas, without its OR clauses. """
+
+	compiled = {}
+	for q in expression.split(";"):
+		for operator, mongo in [("==", "$in"), (":", "$in"), ("!=", "$ne"), (">=", "$gte"),
+				("<=", "$lte"), ("<", "$lt"), (">", "$gt")]:
+			if operator in q:
+				qp = q.split(operator)
+				value = caster.cast(qp[1])
+				compiled.update({qp[0]: {mongo: [value] if mongo == "$in" else value}})
+				break
+
+	return compiled
+
+
+def main():
+
+	expression = sys.argv[1] if len(sys.argv) > 1 else \
+		"Type==Temperature;Value>=20;Value<=30;Zone!=Kitchen;Use:Device;Count>2"
+
+	benchmark = helpers("Benchmark", False)
+	caster = broker(benchmark, None)
+	compiler = query(benchmark, caster)
+
+	runs = [
+		("previous", lambda: previous(expression, caster)),
+		("uncached", lambda: compiler.parse(expression)),
+		("cached", lambda: compiler.compile(expression))
+	]
+
+	print(expression)
+	for name, run in runs:
+		seconds = min(timeit.repeat(run, number=10000, repeat=5)) / 10000
+		print("%-10s %8.2f us" % (name, seconds * 1000000))
+
+
+if __name__ == "__main__":
+	main()
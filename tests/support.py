@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" HIASHDI Test Support.
+
+Builds the HIASHDI modules on an in-memory MongoDB, provided by
+mongomock, with the configuration in configuration/config.json.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import copy
+import logging
+
+import mongomock
+
+from flask import Flask
+
+from modules.broker import broker
+from modules.data import data
+from modules.helpers import helpers
+from modules.mongodb import mongodb
+
+shared = helpers("Tests", False)
+shared.logger.setLevel(logging.CRITICAL)
+confs = copy.deepcopy(shared.confs)
+
+app = Flask("Tests")
+
+
+def create(overrides={}):
+	""" Creates the helpers, mongodb, broker and data modules.
+
+	overrides updates sections of the configuration, i.e.
+	{"entities": {"enabled": True}}.
+	"""
+
+	shared.confs = copy.deepcopy(confs)
+	for section, values in overrides.items():
+		shared.confs[section].update(values)
+
+	database = mongodb(shared)
+	database.mongoCon = mongomock.MongoClient()
+	database.mongoConn = database.mongoCon["hias"]
+	database.collextions = {
+		"Actuator": database.mongoConn.Actuators,
+		"Device": database.mongoConn.Entities,
+		"Sensors": database.mongoConn.Sensors,
+		"Zone": database.mongoConn.Entities
+	}
+
+	brokers = broker(shared, database)
+
+	return shared, database, brokers, data(shared, database, brokers)
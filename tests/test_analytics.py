@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" HIASHDI Analytics Tests.
+
+Tests the summary statistics of historical data.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import os
+import time
+import unittest
+
+from datetime import datetime
+
+from tests.support import create
+
+
+class testAnalytics(unittest.TestCase):
+	""" HIASHDI Analytics Tests. """
+
+	def setUp(self):
+		""" Creates the analytics module in a time zone away from UTC. """
+
+		self.zone = os.environ.get("TZ")
+		os.environ["TZ"] = "America/New_York"
+		time.tzset()
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+		self.analytics = self.data.analytics
+
+	def tearDown(self):
+		""" Restores the time zone. """
+
+		if self.zone is None:
+			del os.environ["TZ"]
+		else:
+			os.environ["TZ"] = self.zone
+		time.tzset()
+
+	def testTimesStayUTC(self):
+		""" Rolling mean times are the naive UTC times read. """
+
+		# 02:30 on March 8 2026 does not exist in New York local time
+		times = [datetime(1960, 1, 1), datetime(2026, 3, 8, 2, 30, 0, 250000)]
+		documents = [{"Time": times[1], "Value": 2}, {"Time": times[0], "Value": 1},
+			{"Value": 3}]
+
+		summary = self.analytics.summarize(documents, ["Value"], [50], 2, 1)
+
+		self.assertEqual(summary["Value"]["rollingMean"],
+			[[None, 3.0], [times[0], 1.0], [times[1], 2.0]])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+""" HIASHDI Broker Tests.
+
+Tests the keyset pagination cursors of the broker.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import unittest
+
+from tests.support import create
+
+
+class testBroker(unittest.TestCase):
+	""" HIASHDI Broker Tests. """
+
+	def setUp(self):
+		""" Creates the broker and some documents to page through. """
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+		self.collection = self.mongodb.mongoConn.Pages
+		self.collection.insert_many([
+			{"name": "a", "rank": 2},
+			{"name": "b", "rank": 1},
+			{"name": "c", "rank": 2},
+			{"name": "d"},
+			{"name": "e", "rank": 3},
+			{"name": "f", "rank": 1}
+		])
+
+	def pages(self, sort, size):
+		""" Pages through the collection, returning the names read. """
+
+		sort = self.broker.cursorSort(sort)
+		names = []
+		token = None
+
+		while True:
+			query = {} if token is None else self.broker.cursorFilter(token, sort)
+			page = list(self.collection.find(query).sort(sort).limit(size))
+			if not len(page):
+				return names
+			names += [entity["name"] for entity in page]
+			token = self.broker.encodeCursor(sort, page[-1])
+
+	def testCursorSortAddsTieBreaker(self):
+		""" _id is appended once to make the ordering total. """
+
+		self.assertEqual(self.broker.cursorSort([("rank", 1)]), [("rank", 1), ("_id", 1)])
+		self.assertEqual(self.broker.cursorSort([("_id", -1)]), [("_id", -1)])
+
+	def testPagesMatchSingleRead(self):
+		""" Paging gives every document once, in the sorted order. """
+
+		for sort in [[("rank", 1)], [("rank", -1)], [("name", -1)]]:
+			with self.subTest(sort=sort):
+				full = self.broker.cursorSort(sort)
+				expected = [entity["name"] for entity in self.collection.find().sort(full)]
+				self.assertEqual(self.pages(sort, 2), expected)
+
+	def testCursorValue(self):
+		""" Dotted keys are read from nested documents. """
+
+		self.assertEqual(self.broker.cursorValue({"a": {"b": 1}}, "a.b"), 1)
+		self.assertIsNone(self.broker.cursorValue({"a": 1}, "a.b"))
+
+	def testInvalidCursors(self):
+		""" Malformed tokens, and tokens of another sort, raise ValueError. """
+
+		sort = self.broker.cursorSort([("rank", 1)])
+		token = self.broker.encodeCursor(sort, {"_id": 1, "rank": 2})
+
+		with self.assertRaises(ValueError):
+			self.broker.cursorFilter("not a cursor", sort)
+		with self.assertRaises(ValueError):
+			self.broker.cursorFilter(token, self.broker.cursorSort([("rank", -1)]))
+
+
+if __name__ == "__main__":
+	unittest.main()
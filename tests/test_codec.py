@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+""" HIASHDI Numeric Series Codec Tests.
+
+Tests that bucketed readings are decoded exactly as they were encoded.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import unittest
+
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+from modules.codec import codec
+
+
+class testCodec(unittest.TestCase):
+	""" HIASHDI Numeric Series Codec Tests. """
+
+	def setUp(self):
+		""" Creates the codec. """
+
+		self.codec = codec()
+
+	def roundTrip(self, readings):
+		""" Encodes and decodes readings. """
+
+		columns, rest, order = self.codec.encode(readings, "Time")
+
+		return columns, self.codec.decode(columns, rest, order)
+
+	def testReadingsRoundTrip(self):
+		""" Readings come back equal, with their fields in order. """
+
+		start = datetime(2026, 1, 1)
+		readings = [{
+			"_id": ObjectId(),
+			"id": "sensor",
+			"Time": start + timedelta(seconds=10 * i, milliseconds=i % 3),
+			"Value": 20.5 + i / 10,
+			"Count": i,
+			"Unit": "C",
+			"State": {"value": i % 2}
+		} for i in range(50)]
+
+		columns, decoded = self.roundTrip(readings)
+
+		self.assertEqual(decoded, readings)
+		for reading in decoded:
+			self.assertEqual(list(reading), list(readings[0]))
+		self.assertEqual(columns["Time"]["kind"], "time")
+		self.assertEqual(columns["_id"]["kind"], "objectid")
+		self.assertEqual(columns["Unit"]["kind"], "constant")
+		self.assertNotIn("State", columns)
+
+	def testLargeIntegersAreExact(self):
+		""" Integer series keep values above 2^53. """
+
+		values = [2 ** 60 + 1, 2 ** 60 + 3, -5, 2 ** 63 - 1]
+
+		self.assertEqual(self.codec.decodeValues(self.codec.encodeValues(values)), values)
+
+	def testMixedSeriesKeepIntegers(self):
+		""" Integers mixed with floats are decoded as integers. """
+
+		readings = [{"Value": value} for value in [0, 1.5, 2, -3.25]]
+
+		columns, decoded = self.roundTrip(readings)
+
+		self.assertEqual(columns["Value"]["kind"], "value")
+		self.assertEqual([type(reading["Value"]) for reading in decoded],
+			[int, float, int, float])
+		self.assertEqual(decoded, readings)
+
+	def testInexactMixedSeriesAreNotColumns(self):
+		""" Integers a float64 cannot hold exactly stay in Rest. """
+
+		readings = [{"Value": 2 ** 60 + 1}, {"Value": 0.5}, {"Value": 2 ** 70}]
+
+		columns, decoded = self.roundTrip(readings)
+
+		self.assertNotIn("Value", columns)
+		self.assertEqual(decoded, readings)
+
+	def testMissingFields(self):
+		""" Fields missing from some readings stay missing. """
+
+		readings = [{"Time": datetime(2026, 1, 1), "Value": 1.5}, {"Time": datetime(2026, 1, 2)}]
+
+		columns, decoded = self.roundTrip(readings)
+
+		self.assertEqual(decoded, readings)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+""" HIASHDI Compression Tests.
+
+Tests the Accept-Encoding negotiation and response compression.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import gzip
+import unittest
+import zlib
+
+from flask import Response
+
+from modules.compression import compression, zstandard
+from tests.support import create
+
+
+class testCompression(unittest.TestCase):
+	""" HIASHDI Compression Tests. """
+
+	def setUp(self):
+		""" Creates the compression module with every encoding. """
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+		self.compression = compression(self.helpers)
+		self.body = b'{"id":"sensor"}' * 200
+
+	def testNegotiate(self):
+		""" Quality wins, ties go to the configured order. """
+
+		self.assertEqual(self.compression.negotiate("gzip, deflate"), "gzip")
+		self.assertEqual(self.compression.negotiate("gzip;q=0.5, deflate"), "deflate")
+		self.assertEqual(self.compression.negotiate("*;q=0.1, gzip;q=0, zstd;q=0"), "deflate")
+		self.assertIsNone(self.compression.negotiate("br"))
+		self.assertIsNone(self.compression.negotiate("gzip;q=bad"))
+		self.assertIsNone(self.compression.negotiate(None))
+
+	def testBufferedResponses(self):
+		""" Large bodies are compressed and their ETag is weakened. """
+
+		response = Response(self.body, 200, {"ETag": '"abc"'}, mimetype="application/json")
+		response = self.compression.compress(response, "gzip")
+
+		self.assertEqual(response.headers["Content-Encoding"], "gzip")
+		self.assertEqual(response.headers["ETag"], 'W/"abc"')
+		self.assertIn("Accept-Encoding", response.headers["Vary"])
+		self.assertEqual(gzip.decompress(response.get_data()), self.body)
+
+	def testSmallResponsesAreNotCompressed(self):
+		""" Bodies under minSize are sent as they are. """
+
+		response = self.compression.compress(Response(b"{}", 200), "gzip")
+
+		self.assertNotIn("Content-Encoding", response.headers)
+		self.assertEqual(response.get_data(), b"{}")
+
+	def testStreamedResponses(self):
+		""" Streamed chunks decompress to the original body. """
+
+		chunks = [self.body[i:i + 100] for i in range(0, len(self.body), 100)]
+		response = Response(iter(chunks), 200, mimetype="application/json")
+		response = self.compression.compress(response, "deflate")
+
+		self.assertEqual(response.headers["Content-Encoding"], "deflate")
+		self.assertEqual(zlib.decompress(b"".join(response.response)), self.body)
+
+	@unittest.skipIf(zstandard is None, "zstandard is not installed")
+	def testZstd(self):
+		""" zstd bodies decompress to the original body. """
+
+		encoded = self.compression.encode(self.body, "zstd")
+
+		self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(encoded),
+			self.body)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+""" HIASHDI Count Tests.
+
+Tests the index hints of counts.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import unittest
+
+from tests.support import create
+
+
+class indexes():
+	""" Stands in for a collection, with given index definitions. """
+
+	def __init__(self, information):
+		""" Initializes the class. """
+
+		self.information = information
+
+	def index_information(self):
+		""" Returns the index definitions. """
+
+		return self.information
+
+
+class testCounts(unittest.TestCase):
+	""" HIASHDI Count Tests. """
+
+	def setUp(self):
+		""" Creates the counts module. """
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+		self.counts = self.data.counts
+
+	def hint(self, information, query):
+		""" Gets the hint for a query over indexes. """
+
+		return self.counts.hint("Sensors", indexes(information), query)
+
+	def testLongestPrefixWins(self):
+		""" The index covering most leading filter fields is hinted. """
+
+		information = {
+			"_id_": {"key": [("_id", 1)]},
+			"Entity_1": {"key": [("Entity", 1)]},
+			"Entity_1_Time_-1": {"key": [("Entity", 1), ("Time", -1)]}
+		}
+
+		self.assertEqual(self.hint(information, {"Entity": "a", "Time": {"$gt": 0}}),
+			"Entity_1_Time_-1")
+		self.assertIsNone(self.hint(information, {"Value": 1}))
+
+	def testSkipsIndexesThatCannotCount(self):
+		""" Sparse, partial, hashed, text, geospatial and wildcard indexes
+		are never hinted. """
+
+		information = {
+			"Entity_sparse": {"key": [("Entity", 1)], "sparse": True},
+			"Entity_partial": {"key": [("Entity", 1)],
+				"partialFilterExpression": {"Entity": {"$exists": True}}},
+			"Entity_hashed": {"key": [("Entity", "hashed")]},
+			"Entity_text": {"key": [("_fts", "text"), ("_ftsx", 1)]},
+			"Entity_2dsphere": {"key": [("Entity", "2dsphere")]},
+			"wildcard": {"key": [("$**", 1)]},
+			"Entity_wildcard": {"key": [("Entity.$**", 1)]}
+		}
+
+		self.assertIsNone(self.hint(information, {"Entity": "a", "_fts": "a"}))
+
+
+if __name__ == "__main__":
+	unittest.main()
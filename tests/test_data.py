@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+""" HIASHDI Data Tests.
+
+Tests the batch creation of data entries.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import unittest
+
+from pymongo.errors import ConnectionFailure
+
+from tests.support import app, create
+
+
+class testData(unittest.TestCase):
+	""" HIASHDI Data Tests. """
+
+	def setUp(self):
+		""" Creates the data module on an empty database. """
+
+		self.context = app.test_request_context()
+		self.context.push()
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+
+	def tearDown(self):
+		""" Removes the request context. """
+
+		self.context.pop()
+
+	def testBatchReportsEachEntry(self):
+		""" Entries that are not objects fail alone. """
+
+		response = self.data.createDatas([{"Value": 1}, 5], "Sensors", ["application/json"])
+		results = json.loads(response.get_data())
+
+		self.assertEqual(response.status_code, 207)
+		self.assertIn("Id", results[0])
+		self.assertIn("Error", results[1])
+
+	def testBatchWriteFailure(self):
+		""" A failed write is answered like a single entry, not raised. """
+
+		def fail(typeof, datas, writeConcern=None):
+			raise ConnectionFailure("MongoDB is unreachable")
+
+		self.data.writeDatas = fail
+
+		response = self.data.createDatas([{"Value": 1}], "Sensors", ["application/json"])
+
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(json.loads(response.get_data()),
+			self.helpers.confs["errorMessages"]["400b"])
+
+
+if __name__ == "__main__":
+	unittest.main()
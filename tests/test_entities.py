@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" HIASHDI Entity Cache Tests.
+
+Tests that cached entity responses are removed when the entity changes.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import unittest
+
+from tests.support import app, create
+
+
+class testEntities(unittest.TestCase):
+	""" HIASHDI Entity Cache Tests. """
+
+	def setUp(self):
+		""" Creates a Sensors entry on an empty database. """
+
+		self.context = app.test_request_context()
+		self.context.push()
+
+		self.helpers, self.mongodb, self.broker, self.data = create(
+			{"entities": {"enabled": True}})
+		self._id = str(self.mongodb.mongoConn.Sensors.insert_one(
+			{"id": "sensor", "type": "Sensors", "temperature": 1}).inserted_id)
+
+	def tearDown(self):
+		""" Removes the request context. """
+
+		self.context.pop()
+
+	def read(self, attrs):
+		""" Gets the entry and returns its body and ETag. """
+
+		response = self.data.getData("Sensors", self._id, attrs, ["application/json"])
+
+		return json.loads(response.get_data()), response.headers["ETag"]
+
+	def testPatchEvictsProjectedResponse(self):
+		""" An attrs projection without id is removed by a PATCH. """
+
+		body, etag = self.read("temperature")
+		self.assertEqual(body["temperature"], 1)
+		self.assertNotIn("id", body)
+
+		response = self.data.updateEntityPatch("sensor", "Sensors",
+			{"temperature": 99}, None, ["application/json"])
+		self.assertEqual(response.status_code, 204)
+
+		body, changed = self.read("temperature")
+		self.assertEqual(body["temperature"], 99)
+		self.assertNotEqual(changed, etag)
+
+	def testRepeatedReadIsCached(self):
+		""" An unchanged entry is served from the cache. """
+
+		self.read(None)
+		self.read(None)
+
+		self.assertEqual(self.data.entities.stats()["Hits"], 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+""" HIASHDI Export Tests.
+
+Tests the column types of columnar exports.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import unittest
+
+import pyarrow as pa
+
+from tests.support import create
+
+
+class testExport(unittest.TestCase):
+	""" HIASHDI Export Tests. """
+
+	def setUp(self):
+		""" Creates the export module, with batches of two documents. """
+
+		self.helpers, self.mongodb, self.broker, self.data = create(
+			{"export": {"batchSize": 2}})
+		self.export = self.data.export
+
+	def read(self, documents, sample=[]):
+		""" Exports documents as an Arrow stream and reads it back. """
+
+		stream = b"".join(self.export.generate(iter(documents), "arrow", sample))
+
+		return pa.ipc.open_stream(stream).read_all()
+
+	def testSampleAddsColumns(self):
+		""" Attributes missing from the first batch come from the sample. """
+
+		collection = self.mongodb.mongoConn.Sensors
+		collection.insert_many([{"Value": 1.5, "Unit": "C"}, {"Value": 2.5}])
+
+		table = self.read([{"Value": 1.5}], self.export.sample(collection))
+
+		self.assertEqual(table.schema.field("Value").type, pa.float64())
+		self.assertEqual(table.schema.field("Unit").type, pa.string())
+
+	def testSampleWidensTypes(self):
+		""" Kinds found in the sample widen the columns of the first batch. """
+
+		table = self.read([{"Value": 1.5}, {"Value": 2.5}, {"Value": "off"}],
+			[{"Value": "on"}])
+
+		self.assertEqual(table.column("Value").to_pylist(), ["1.5", "2.5", "off"])
+
+	def testMixedColumnsAreStrings(self):
+		""" A column holding mixed kinds of values is exported as strings. """
+
+		table = self.read([{"Value": 1}, {"Value": "on"}])
+
+		self.assertEqual(table.column("Value").to_pylist(), ["1", "on"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+""" HIASHDI Fan-out Tests.
+
+Tests multi type listings merged in time order.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import unittest
+
+from datetime import datetime
+
+from tests.support import create
+
+
+class tracked():
+	""" Wraps a cursor to record whether it was closed. """
+
+	def __init__(self, cursor, closed):
+		""" Initializes the class. """
+
+		self.cursor = cursor
+		self.closed = closed
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		return next(self.cursor)
+
+	def sort(self, sort):
+		self.cursor = self.cursor.sort(sort)
+		return self
+
+	def limit(self, limit):
+		self.cursor = self.cursor.limit(limit)
+		return self
+
+	def batch_size(self, size):
+		return self
+
+	def close(self):
+		if self not in self.closed:
+			self.closed.append(self)
+
+
+class testFanout(unittest.TestCase):
+	""" HIASHDI Fan-out Tests. """
+
+	def setUp(self):
+		""" Writes readings of two types with mixed time types. """
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+		self.fanout = self.data.fanout
+
+		self.mongodb.mongoConn.Sensors.insert_many([
+			{"Time": datetime(2026, 1, 1)}, {"Time": datetime(2026, 1, 3)}])
+		self.mongodb.mongoConn.Life.insert_many([
+			{"Time": datetime(2026, 1, 2)}, {"Time": "2026-01-04"}, {"Value": 1}])
+
+		self.closed = []
+		getCollection = self.data.getCollection
+		self.failing = None
+
+		def collection(typeof):
+			if typeof == self.failing:
+				raise RuntimeError("query failed")
+			original = getCollection(typeof)
+			wrapper = type("collection", (), {})()
+			wrapper.find = lambda query, fields: tracked(original.find(query, fields), self.closed)
+			return wrapper
+
+		self.data.getCollection = collection
+
+	def testMergesByTypeRankedTime(self):
+		""" Missing times come first, then strings, then dates. """
+
+		merged = list(self.fanout.find(["Sensors", "Life"], {}, None, 1, 0, 0))
+
+		self.assertEqual([document.get("Time") for document in merged], [None, "2026-01-04",
+			datetime(2026, 1, 1), datetime(2026, 1, 2), datetime(2026, 1, 3)])
+		self.assertEqual([document["DataType"] for document in merged][:2], ["Life", "Life"])
+		self.assertEqual(len(self.closed), 2)
+
+	def testLimitClosesSources(self):
+		""" Sources are closed when the limit ends the merge. """
+
+		merged = list(self.fanout.find(["Sensors", "Life"], {}, None, -1, 0, 1))
+
+		self.assertEqual(merged[0]["Time"], datetime(2026, 1, 3))
+		self.assertEqual(len(self.closed), 2)
+
+	def testFailedQueryClosesOpenedCursors(self):
+		""" Cursors opened before another type fails are closed. """
+
+		self.failing = "Life"
+
+		with self.assertRaises(RuntimeError):
+			self.fanout.find(["Sensors", "Life"], {}, None, 1, 0, 0)
+
+		self.assertEqual(len(self.closed), 1)
+
+	def testRejectsLatest(self):
+		""" Latest values cannot be merged. """
+
+		with self.assertRaises(ValueError):
+			self.fanout.prepare({"options": "latest"}, ["Sensors", "Life"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+""" HIASHDI Latest Values Tests.
+
+Tests the latest values kept per entity and their listing.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import json
+import unittest
+
+from datetime import datetime
+
+from tests.support import app, create
+
+
+class testLatest(unittest.TestCase):
+	""" HIASHDI Latest Values Tests. """
+
+	def setUp(self):
+		""" Writes two readings of an entity, the newest first. """
+
+		self.context = app.test_request_context()
+		self.context.push()
+
+		self.helpers, self.mongodb, self.broker, self.data = create(
+			{"latest": {"enabled": True}})
+		self.data.insertDatas("Sensors", [
+			{"Entity": "sensor", "Time": datetime(2026, 1, 2), "Value": 2},
+			{"Entity": "sensor", "Time": datetime(2026, 1, 1), "Value": 1, "Unit": "C"}
+		])
+
+	def tearDown(self):
+		""" Removes the request context. """
+
+		self.context.pop()
+
+	def list(self, arguments):
+		""" Lists the latest values and returns the decoded body. """
+
+		arguments = dict(arguments, type="Sensors", options="latest")
+		response = self.data.getLatest(arguments, ["application/json"])
+		self.assertEqual(response.status_code, 200)
+
+		return json.loads(response.get_data())
+
+	def testLateDataOnlySetsNewerAttributes(self):
+		""" Late data does not overwrite newer values. """
+
+		entity = self.list({})[0]
+
+		self.assertEqual(entity["Value"], 2)
+		self.assertEqual(entity["Unit"], "C")
+
+	def testTimesAreNotListed(self):
+		""" The internal attribute times are projected out. """
+
+		for attrs in [None, "*", "Value", "Times"]:
+			for entity in self.list({"attrs": attrs} if attrs else {}):
+				self.assertNotIn("Times", entity)
+
+
+if __name__ == "__main__":
+	unittest.main()
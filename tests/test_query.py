@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+""" HIASHDI Query Tests.
+
+Tests that q expressions compile into the expected MongoDB filters.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import unittest
+
+from tests.support import create
+
+
+class testQuery(unittest.TestCase):
+	""" HIASHDI Query Tests. """
+
+	def setUp(self):
+		""" Creates the query module. """
+
+		self.helpers, self.mongodb, self.broker, self.data = create()
+		self.query = self.data.query
+
+	def testClauses(self):
+		""" Each operator compiles to its MongoDB condition. """
+
+		self.assertEqual(self.query.compile("temperature>20"), {"temperature": {"$gt": 20.0}})
+		self.assertEqual(self.query.compile("temperature<=20"), {"temperature": {"$lte": 20.0}})
+		self.assertEqual(self.query.compile("status==on,off"), {"status": {"$in": ["on", "off"]}})
+		self.assertEqual(self.query.compile("status!=on"), {"status": {"$ne": "on"}})
+		self.assertEqual(self.query.compile("status!=on,off"), {"status": {"$nin": ["on", "off"]}})
+		self.assertEqual(self.query.compile("name~=^Sen"), {"name": {"$regex": "^Sen"}})
+		self.assertEqual(self.query.compile("battery"), {"battery": {"$exists": True}})
+		self.assertEqual(self.query.compile("!battery"), {"battery": {"$exists": False}})
+
+	def testRanges(self):
+		""" Ranges compile to inclusive bounds, or their negation. """
+
+		self.assertEqual(self.query.compile("temperature==10..20"),
+			{"temperature": {"$gte": 10.0, "$lte": 20.0}})
+		self.assertEqual(self.query.compile("temperature!=10..20"),
+			{"temperature": {"$not": {"$gte": 10.0, "$lte": 20.0}}})
+
+	def testQuotedValues(self):
+		""" Quoted values are not cast and may hold separators. """
+
+		self.assertEqual(self.query.compile("code=='20'"), {"code": {"$in": ["20"]}})
+		self.assertEqual(self.query.compile("name=='a;b,c'"), {"name": {"$in": ["a;b,c"]}})
+		self.assertEqual(self.query.compile("name==\"x||y\";on==true"),
+			{"name": {"$in": ["x||y"]}, "on": {"$in": [True]}})
+
+	def testStatements(self):
+		""" Statements are ANDed, repeated attributes use $and, || ORs. """
+
+		self.assertEqual(self.query.compile("a>1;a<5"),
+			{"a": {"$gt": 1.0}, "$and": [{"a": {"$lt": 5.0}}]})
+		self.assertEqual(self.query.compile("a>1||b<5"),
+			{"$or": [{"a": {"$gt": 1.0}}, {"b": {"$lt": 5.0}}]})
+
+	def testInvalidExpressions(self):
+		""" Malformed clauses raise ValueError. """
+
+		for expression in ["a=b", "!a=b", "a==", "==1", "name=='open", "a>'1"]:
+			with self.subTest(expression=expression):
+				with self.assertRaises(ValueError):
+					self.query.compile(expression)
+
+	def testCacheReturnsCopies(self):
+		""" Cached filters are counted and callers cannot change them. """
+
+		first = self.query.compile("status==on,off")
+		first["status"]["$in"].append("broken")
+		first["extra"] = 1
+
+		self.assertEqual(self.query.compile("status==on,off"), {"status": {"$in": ["on", "off"]}})
+		self.assertEqual(self.query.stats(), {"Size": 1, "Hits": 1, "Misses": 1})
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+""" HIASHDI Spill Log Tests.
+
+Tests that spilled entries are replayed once, even when a replay is
+interrupted, and that spilling needs several slow writes.
+
+MIT License
+
+Copyright (c) 2021 Asociación de Investigacion en Inteligencia Artificial
+Para la Leucemia Peter Moss
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files(the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and / or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+Contributors:
+- Adam Milton-Barker
+
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from pymongo.errors import AutoReconnect
+
+from modules.spill import spill
+from tests.support import create
+
+
+class writer():
+	""" Stands in for the data module, failing one write. """
+
+	def __init__(self, failAt=None):
+		""" Initializes the class. """
+
+		self.failAt = failAt
+		self.written = []
+
+	def writeDatas(self, typeof, batch):
+		""" Records a batch, or raises on the failing write. """
+
+		if len(self.written) == self.failAt:
+			self.failAt = None
+			raise AutoReconnect("connection lost")
+		self.written.append([entry["n"] for entry in batch])
+		return []
+
+
+class testSpill(unittest.TestCase):
+	""" HIASHDI Spill Log Tests. """
+
+	def setUp(self):
+		""" Creates a spill log in a temporary directory. """
+
+		self.directory = tempfile.mkdtemp()
+		self.helpers, self.mongodb, self.broker, self.data = create({"spill": {
+			"directory": self.directory,
+			"replayBatchSize": 2,
+			"replayRate": 1000000,
+			"segmentSize": 4096
+		}})
+
+	def tearDown(self):
+		""" Removes the temporary directory. """
+
+		shutil.rmtree(self.directory)
+
+	def testInterruptedReplayResumes(self):
+		""" A replay stopped by an error does not insert entries twice. """
+
+		data = writer(failAt=2)
+		log = spill(self.helpers, self.mongodb, data)
+		log.write("Sensors", [{"n": n} for n in range(5)])
+		log.write("Sensors", [{"n": n} for n in range(5, 8)])
+		log.seal()
+
+		log.replay()
+		self.assertFalse(self.mongodb.healthy)
+		self.mongodb.healthy = True
+		log.replay()
+
+		self.assertEqual(data.written, [[0, 1], [2, 3], [4], [5, 6], [7]])
+		self.assertEqual(log.segments(), [])
+
+	def testSpillsAfterConsecutiveSlowWrites(self):
+		""" A fast write resets the count of slow writes. """
+
+		log = spill(self.helpers, self.mongodb, writer())
+		threshold = self.helpers.confs["spill"]["latencyThreshold"]
+		samples = self.helpers.confs["spill"]["latencySamples"]
+
+		for i in range(samples - 1):
+			log.recordLatency(threshold + 1)
+		log.recordLatency(threshold)
+		for i in range(samples - 1):
+			log.recordLatency(threshold + 1)
+		self.assertFalse(log.spilling())
+
+		log.recordLatency(threshold + 1)
+		self.assertTrue(log.spilling())
+
+	def testRejectsBuckets(self):
+		""" Spilling is refused for layouts without a unique _id. """
+
+		with self.assertRaises(ValueError):
+			create({
+				"buckets": {"enabled": True, "mode": "buckets"},
+				"spill": {"enabled": True, "directory": self.directory}
+			})
+
+
+if __name__ == "__main__":
+	unittest.main()